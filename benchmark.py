@@ -0,0 +1,445 @@
+import argparse
+import copy
+import json
+import platform
+import random as rd
+import subprocess
+import time
+import tracemalloc
+
+from environment import Environment, Action
+from evaluator import evaluate
+from maps import generateMap
+from mctsagent import MCTSAgent
+from qtable import QTable
+from rlagent import RLAgent
+from walkeragent import WalkerAgent
+
+
+def makeEnvironment(size, seed=0):
+    # The hard-coded map for 5x5, generated road grids for the other sizes
+    environment = Environment() if size == 5 else Environment(gameMap=generateMap(size, size, seed=seed))
+    environment.reset()
+    return environment
+
+
+def fillQ(agent, qSize):
+    # Random entries plus the states the benchmark will actually look up
+    q = agent.q
+    for _ in range(qSize):
+        q[rd.getrandbits(40), rd.choice(list(Action))] = rd.uniform(-50, 50)
+    for a in Action:
+        q[agent.environment.getState(), a] = rd.uniform(-50, 50)
+
+
+def measure(function, minTime):
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime:
+            break
+        calls *= 2
+
+    allocationCalls = min(calls, 1000)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(allocationCalls):
+        function()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "calls": calls,
+        "usPerCall": elapsed / calls * 1e6,
+        "callsPerSec": calls / elapsed,
+        "retainedBytesPerCall": (after - before) / allocationCalls,
+        "peakBytes": peak - before,
+    }
+
+
+def measureAction(environment, snapshot, action, minTime):
+    # Like measure, but every call plays action from the same state: the grid is restored
+    # before each call and only doAction is timed
+    timer = time.perf_counter
+    calls = 0
+    elapsed = 0
+    while elapsed < minTime:
+        environment.restore(snapshot)
+        start = timer()
+        environment.doAction(0, action)
+        elapsed += timer() - start
+        calls += 1
+    overhead = timer()
+    for _ in range(calls):
+        timer()
+    overhead = (timer() - overhead) / calls
+    elapsed -= calls * overhead
+
+    tracemalloc.start()
+    retained = 0
+    peak = 0
+    for _ in range(min(calls, 1000)):
+        environment.restore(snapshot)
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        environment.doAction(0, action)
+        after, callPeak = tracemalloc.get_traced_memory()
+        retained += after - before
+        peak = max(peak, callPeak - before)
+    tracemalloc.stop()
+    environment.restore(snapshot)
+
+    return {
+        "calls": calls,
+        "usPerCall": elapsed / calls * 1e6,
+        "callsPerSec": calls / elapsed,
+        "retainedBytesPerCall": retained / min(calls, 1000),
+        "peakBytes": peak,
+    }
+
+
+def findSnapshot(environment, action, ticks=10000):
+    # Snapshot of the first state of a seeded random play where agent 0 can do action, or of
+    # the start state if none is found
+    rd.seed(0)
+    environment.reset()
+    agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+    for _ in range(ticks):
+        if action in environment.getLegalActions(0):
+            break
+        environment.runTick(agents)
+    else:
+        environment.reset()
+    return environment.snapshot()
+
+
+def benchmarkEnvironment(size, minTime):
+    environment = makeEnvironment(size)
+    agent = RLAgent(environment, 0)
+    walker = RLAgent(environment, 1)
+
+    def runStep():
+        environment.runStep(agent)
+        environment.runStep(walker, True)
+
+    snapshots = {action: findSnapshot(environment, action) for action in Action}
+    cases = {
+        "Environment.runStep": runStep,
+        "Environment.getLegalActions": lambda: environment.getLegalActions(0),
+        "Environment.__repr__": lambda: repr(environment),
+        "Environment.isFinal": environment.isFinal,
+        "Environment.reset": environment.reset,
+    }
+
+    results = []
+    for name, function in cases.items():
+        environment.reset()
+        result = measure(function, minTime)
+        if name == "Environment.runStep":
+            result["stepsPerSec"] = 2 * result["callsPerSec"]
+        results.append(dict(name=name, grid=size, **result))
+    for action in Action:
+        results.append(dict(name="Environment.doAction." + action.name, grid=size,
+                            **measureAction(environment, snapshots[action], action, minTime)))
+    return results
+
+
+def benchmarkSnapshots(size, minTime, ticks=20):
+    # Cloning the environment with copy.deepcopy against snapshot()/restore(), restoring in turn
+    # two snapshots ticks random ticks apart as a lookahead search would
+    environment = makeEnvironment(size)
+    agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+    snapshots = [environment.snapshot()]
+    for _ in range(ticks):
+        environment.runTick(agents)
+    snapshots.append(environment.snapshot())
+    restores = [0]
+
+    def restore():
+        restores[0] += 1
+        environment.restore(snapshots[restores[0] % 2])
+
+    cases = {
+        "Environment.deepcopy": lambda: copy.deepcopy(environment),
+        "Environment.snapshot": environment.snapshot,
+        "Environment.restore": restore,
+    }
+    return [dict(name=name, grid=size, **measure(function, minTime)) for name, function in cases.items()]
+
+
+def benchmarkSearch(size, minTime):
+    # One MCTS simulation from the start state, the tree growing as it would during a decision
+    environment = makeEnvironment(size)
+    agent = MCTSAgent(environment, 0, min(environment.agentCells.keys() - {0}), simulations=1)
+    agent.search(environment.getState())
+    snapshot = environment.snapshot()
+    result = measure(agent.simulate, minTime)
+    environment.restore(snapshot)
+    result["simulationsPer10ms"] = 10000 / result["usPerCall"]
+    return [dict(name="MCTSAgent.simulate", grid=size, **result)]
+
+
+def benchmarkAgent(size, qSize, backend, minTime):
+    environment = makeEnvironment(size)
+    agent = RLAgent(environment, 0, QTable() if backend == "qtable" else None)
+    agent.epsilon = 0
+    fillQ(agent, qSize)
+
+    state = environment.getState()
+    legalActions = environment.getLegalActions(0)
+    cases = {
+        "RLAgent.selectAction": lambda: agent.selectAction(state, legalActions),
+        "RLAgent.updateQValues": lambda: agent.updateQValues(state, legalActions[0], state, -1, False, legalActions),
+        "RLAgent.getBestPolicy": lambda: agent.getBestPolicy(state, legalActions),
+    }
+
+    results = []
+    for name, function in cases.items():
+        results.append(dict(name=name, grid=size, qSize=qSize, backend=backend, **measure(function, minTime)))
+    return results
+
+
+def benchmarkScaling(size, steps, samples=10):
+    # Training cost per tick and Q-table growth on a generated size x size map
+    environment = makeEnvironment(size)
+    agent = RLAgent(environment, 0, QTable())
+    walker = RLAgent(environment, 1)
+
+    growth = []
+    elapsed = 0
+    for sample in range(samples):
+        start = time.perf_counter()
+        for _ in range(steps // samples):
+            environment.runStep(agent)
+            environment.runStep(walker, True)
+        elapsed += time.perf_counter() - start
+        growth.append([(sample + 1) * (steps // samples), agent.q.nStates, len(agent.q)])
+
+    ticks = samples * (steps // samples)
+    return {"name": "scaling", "grid": size, "steps": ticks, "usPerStep": elapsed / ticks * 1e6,
+            "stepsPerSec": ticks / elapsed, "qStates": agent.q.nStates, "qEntries": len(agent.q),
+            "qBytes": agent.q.values.nbytes + agent.q.keyArray.nbytes + agent.q.idArray.nbytes, "growth": growth}
+
+
+def benchmarkAgents(nAgents, ticks, size=20):
+    # One learner and nAgents - 1 walkers: sequential runStep per agent against one runTick
+    results = []
+    for mode in ("runStep", "runTick"):
+        rd.seed(0)
+        environment = Environment(gameMap=generateMap(size, size, victims=10, starts=nAgents, seed=nAgents))
+        environment.reset()
+        agent = RLAgent(environment, 0, QTable())
+        walkers = [WalkerAgent(environment, agentId) for agentId in range(1, nAgents)]
+
+        start = time.perf_counter()
+        if mode == "runStep":
+            for _ in range(ticks):
+                environment.runStep(agent)
+                for walker in walkers:
+                    environment.runStep(walker, True)
+        else:
+            agents = [agent] + walkers
+            for _ in range(ticks):
+                environment.runTick(agents)
+        elapsed = time.perf_counter() - start
+        results.append({"name": "agents." + mode, "grid": size, "agents": nAgents, "ticks": ticks,
+                        "usPerTick": elapsed / ticks * 1e6, "usPerAgent": elapsed / ticks / nAgents * 1e6})
+    return results
+
+
+def benchmarkMemory(size):
+    # Bytes per cell of the grid alone (Cell and flag objects), then of the whole environment
+    # once the map is applied and the move tables are compiled
+    gameMap = None if size == 5 else generateMap(size, size, seed=0)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    environment = Environment(gameMap=gameMap)
+    grid, _ = tracemalloc.get_traced_memory()
+    environment.reset()
+    total, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cells = environment.w * environment.h
+    return {"name": "memory", "grid": size, "cells": cells, "gridBytesPerCell": (grid - before) / cells,
+            "bytesPerCell": (total - before) / cells}
+
+
+def benchmarkCollisions(size, ticks, nAgents=2):
+    # Random play with Zobrist hashing on: every hash is checked against the exact StateEncoder
+    # key of the same state. Reports the observed collisions, the birthday bound for that many
+    # distinct states (n^2 / 2^65) and the cost per tick with and without hashing.
+    results = {"name": "collisions", "grid": size, "agents": nAgents, "ticks": ticks}
+    for hashing in (False, True):
+        rd.seed(0)
+        gameMap = None if size == 5 else generateMap(size, size, starts=nAgents, seed=0)
+        environment = Environment(gameMap=gameMap)
+        environment.reset()
+        if hashing:
+            environment.enableHashing()
+        agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            environment.runTick(agents)
+            environment.getState()
+        results["usPerTickHashed" if hashing else "usPerTick"] = (time.perf_counter() - start) / ticks * 1e6
+
+    rd.seed(0)
+    environment = Environment(gameMap=gameMap)
+    environment.reset()
+    environment.enableHashing()
+    agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+    exactKeys = {}
+    collisions = 0
+    for _ in range(ticks):
+        environment.runTick(agents)
+        exact = environment.encoder.encode(environment)
+        known = exactKeys.setdefault(environment.getState(), exact)
+        collisions += known != exact
+    states = len(set(exactKeys.values()))
+    results.update(states=states, collisions=collisions, birthdayBound=states * (states - 1) / 2 ** 65)
+    return results
+
+
+# Settings compared by benchmarkAbstractions, as Environment.enableAbstraction arguments
+ABSTRACTIONS = {
+    "exact": {},
+    "count": {"inventoryCount": True},
+    "count-orientations": {"inventoryCount": True, "otherOrientations": False},
+    "count-radius3": {"inventoryCount": True, "radius": 3},
+    "count-radius2": {"inventoryCount": True, "radius": 2},
+    "count-radius1": {"inventoryCount": True, "radius": 1},
+    "count-orientations-radius2": {"inventoryCount": True, "otherOrientations": False, "radius": 2},
+}
+
+
+def benchmarkAbstractions(size, steps, episodes=200):
+    # Q-learning under every state abstraction of ABSTRACTIONS with the same seed: distinct
+    # states visited, table entries, cost per step and greedy mean saved afterwards
+    results = []
+    for name, options in ABSTRACTIONS.items():
+        rd.seed(0)
+        environment = makeEnvironment(size)
+        if options:
+            environment.enableAbstraction(0, **options)
+        agent = RLAgent(environment, 0, QTable())
+        agent.discountEpsilon = 0.99999
+        walker = RLAgent(environment, 1)
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            environment.runStep(agent)
+            environment.runStep(walker, True)
+        elapsed = time.perf_counter() - start
+        summary = evaluate(agent, episodes)
+        results.append({"name": "abstraction." + name, "grid": size, "steps": steps, "states": agent.q.nStates,
+                        "entries": len(agent.q), "usPerStep": elapsed / steps * 1e6, "meanSaved": summary["meanSaved"]})
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def resultKey(result):
+    return result["name"], result["grid"], result.get("qSize"), result.get("backend")
+
+
+def compare(results, baselinePath):
+    with open(baselinePath) as file:
+        baseline = {resultKey(result): result for result in json.load(file)["results"]}
+    for result in results:
+        old = baseline.get(resultKey(result))
+        if old is not None:
+            print("%-30s grid=%-4s q=%-8s %-7s %10.2f us -> %10.2f us  x%.2f" % (
+                result["name"], result["grid"], result.get("qSize", ""), result.get("backend", ""),
+                old["usPerCall"], result["usPerCall"], old["usPerCall"] / result["usPerCall"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the environment and agent hot paths")
+    parser.add_argument("--grids", type=int, nargs="+", default=[5, 10, 25])
+    parser.add_argument("--q-sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--backends", nargs="+", default=["dict", "qtable"], choices=["dict", "qtable"])
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds spent timing each case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scaling", type=int, nargs="*", default=None, metavar="SIZE",
+                        help="instead of the hot paths, train on generated maps of these sizes and report step cost and Q-table growth")
+    parser.add_argument("--scaling-steps", type=int, default=100000)
+    parser.add_argument("--agents", type=int, nargs="*", default=None, metavar="N",
+                        help="instead of the hot paths, compare runStep per agent with runTick for N agents on a 20x20 map")
+    parser.add_argument("--agents-ticks", type=int, default=20000)
+    parser.add_argument("--collisions", type=int, nargs="*", default=None, metavar="SIZE",
+                        help="instead of the hot paths, check Zobrist state hashes against exact keys on maps of these sizes")
+    parser.add_argument("--collisions-ticks", type=int, default=200000)
+    parser.add_argument("--memory", type=int, nargs="*", default=None, metavar="SIZE",
+                        help="instead of the hot paths, report the bytes per cell of environments of these sizes")
+    parser.add_argument("--abstractions", type=int, nargs="*", default=None, metavar="SIZE",
+                        help="instead of the hot paths, train with every state abstraction on maps of these sizes and report the states visited")
+    parser.add_argument("--abstractions-steps", type=int, default=300000)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="previous output file to compare against")
+    args = parser.parse_args()
+
+    rd.seed(args.seed)
+    results = []
+    if args.scaling is not None or args.agents is not None or args.memory is not None or args.collisions is not None or \
+            args.abstractions is not None:
+        for size in [] if args.scaling is None else args.scaling or [5, 10, 25, 50, 100]:
+            result = benchmarkScaling(size, args.scaling_steps)
+            print("grid=%-4s %8.2f us/step %10.0f steps/s %9d states %9d entries %10d bytes" % (
+                size, result["usPerStep"], result["stepsPerSec"], result["qStates"], result["qEntries"], result["qBytes"]))
+            results.append(result)
+        for nAgents in [] if args.agents is None else args.agents or [2, 5, 10, 20]:
+            for result in benchmarkAgents(nAgents, args.agents_ticks):
+                print("%-15s agents=%-3s %9.2f us/tick %8.2f us/agent" % (result["name"], nAgents, result["usPerTick"], result["usPerAgent"]))
+                results.append(result)
+        for size in [] if args.memory is None else args.memory or [5, 10, 100, 300]:
+            result = benchmarkMemory(size)
+            print("grid=%-4s %9d cells %8.1f B/cell grid %8.1f B/cell with tables" % (
+                size, result["cells"], result["gridBytesPerCell"], result["bytesPerCell"]))
+            results.append(result)
+        for size in [] if args.collisions is None else args.collisions or [5, 25, 100]:
+            for nAgents in (2,) if size == 5 else (2, 20):
+                result = benchmarkCollisions(size, args.collisions_ticks, nAgents)
+                print("grid=%-4s agents=%-3s %9d states %4d collisions %9.2g bound %8.2f us/tick exact %8.2f us/tick hashed" % (
+                    size, nAgents, result["states"], result["collisions"], result["birthdayBound"], result["usPerTick"], result["usPerTickHashed"]))
+                results.append(result)
+        for size in [] if args.abstractions is None else args.abstractions or [5, 10]:
+            for result in benchmarkAbstractions(size, args.abstractions_steps):
+                print("%-40s grid=%-4s %9d states %9d entries %8.2f us/step %6.2f saved" % (
+                    result["name"], size, result["states"], result["entries"], result["usPerStep"], result["meanSaved"]))
+                results.append(result)
+        with open(args.output, "w") as file:
+            json.dump({"commit": gitCommit(), "python": platform.python_version(), "time": time.time(), "results": results}, file, indent=1)
+        return
+
+    for size in args.grids:
+        results += benchmarkEnvironment(size, args.min_time)
+        results += benchmarkSnapshots(size, args.min_time)
+        results += benchmarkSearch(size, args.min_time)
+        for qSize in args.q_sizes:
+            for backend in args.backends:
+                results += benchmarkAgent(size, qSize, backend, args.min_time)
+
+    for result in results:
+        print("%-30s grid=%-4s q=%-8s %-7s %10.2f us %14.0f calls/s %10.1f B/call" % (
+            result["name"], result["grid"], result.get("qSize", ""), result.get("backend", ""),
+            result["usPerCall"], result["callsPerSec"], result["retainedBytesPerCall"]))
+
+    with open(args.output, "w") as file:
+        json.dump({"commit": gitCommit(), "python": platform.python_version(), "time": time.time(), "results": results}, file, indent=1)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
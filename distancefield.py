@@ -0,0 +1,88 @@
+from array import array
+from collections import deque
+
+
+class DistanceField:
+    # Shortest number of LEFT/MOVE/RIGHT actions from every (cell, orientation) node of the
+    # directed road graph to the hospitals and to the victims still on the ground. Agents can't
+    # U-turn, so the orientation is part of the node: node = (x * h + y) * 4 + orientation.
+    # Tables are computed once per map (victim tables once per set of remaining victims), so
+    # every lookup during an episode is O(1).
+    def __init__(self, environment, scale: float=1.0, gamma: float=1.0):
+        self.environment = environment
+        self.scale = scale
+        self.gamma = gamma
+        self.h = environment.h
+        self.nNodes = environment.w * environment.h * 4
+        self.unreachable = self.nNodes
+
+        self.predecessors = [[] for _ in range(self.nNodes)]
+        for node in range(self.nNodes):
+            for _, orientation, nextCell in environment.moves[node]:
+                self.predecessors[self.getNode(nextCell, orientation)].append(node)
+
+        hospitals = [cell for column in environment.cellGrid for cell in column if cell.hospitalFlag.index != -1]
+        self.toHospital = self._search(hospitals)
+        self.victimTables = {}
+        self.victimChanges = None
+        self.toVictim = None
+
+    def getNode(self, cell, orientation):
+        return (cell.x * self.h + cell.y) * 4 + orientation
+
+    def _search(self, cells):
+        # Multi-source BFS on the reversed graph from every orientation of the target cells
+        distances = array('i', [self.unreachable]) * self.nNodes
+        queue = deque()
+        for cell in cells:
+            for orientation in range(4):
+                node = self.getNode(cell, orientation)
+                distances[node] = 0
+                queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for previous in self.predecessors[node]:
+                if distances[previous] == self.unreachable:
+                    distances[previous] = distances[node] + 1
+                    queue.append(previous)
+        return distances
+
+    def getVictimTable(self):
+        # The table is only looked up again once the set of victims on the ground changed (a
+        # pick, a reset or a restore), see Environment.victimChanges
+        if self.environment.victimChanges != self.victimChanges:
+            key = frozenset(self.environment.victimCells)
+            if key not in self.victimTables:
+                self.victimTables[key] = self._search(self.environment.victimCells.values())
+            self.toVictim = self.victimTables[key]
+            self.victimChanges = self.environment.victimChanges
+        return self.toVictim
+
+    def getTargetDistance(self, cell, orientation, carried):
+        # Distance to the nearest useful target: a victim while there is room left, the
+        # hospital while carrying someone
+        node = self.getNode(cell, orientation)
+        distance = self.unreachable
+        if carried < 2 and self.environment.victimCount > 0:
+            distance = self.getVictimTable()[node]
+        if carried > 0:
+            distance = min(distance, self.toHospital[node])
+        return distance
+
+    def getDistance(self, agentId):
+        cell = self.environment.agentCells[agentId]
+        return self.getTargetDistance(cell, cell.agentFlag.orientation, len(cell.agentFlag.inventory))
+
+    def potential(self, agentId):
+        # Potential for reward shaping, see Environment.shaping; getTargetDistance inlined
+        # since it runs twice per learner step
+        cell = self.environment.agentCells[agentId]
+        carried = len(cell.agentFlag.inventory)
+        node = (cell.x * self.h + cell.y) * 4 + cell.agentFlag.orientation
+        distance = self.unreachable
+        if carried < 2 and self.environment.victimCount > 0:
+            distance = (self.toVictim if self.environment.victimChanges == self.victimChanges else self.getVictimTable())[node]
+        if carried > 0 and self.toHospital[node] < distance:
+            distance = self.toHospital[node]
+        return -self.scale * distance
@@ -0,0 +1,259 @@
+import random as rd
+
+import numpy as np
+
+from schedules import ConstantSchedule, ExponentialSchedule
+
+N_ACTIONS = 6
+# Observation planes, each of w * h cells indexed x * h + y like in VectorEnvironment
+ROADS = 0  # 4 planes, one per open orientation
+HOSPITALS = 4
+VICTIMS = 5  # victims on the ground
+POSITION = 6
+ORIENTATIONS = 7  # 4 planes, the learner's orientation on its cell
+OTHERS = 11  # the other agents
+INVENTORY = 12  # number of victims carried by the learner, on its cell
+N_PLANES = 13
+
+
+class MLP:
+    # Fully connected ReLU network with a linear output, trained with Adam on the Huber loss of
+    # one output per row. Every pass is a matrix product over the whole batch.
+    def __init__(self, sizes, rng, learningRate: float=1e-3):
+        self.learningRate = learningRate
+        self.weights = [(rng.standard_normal((n, m)) * np.sqrt(2 / n)).astype(np.float32) for n, m in zip(sizes[:-1], sizes[1:])]
+        self.biases = [np.zeros(m, dtype=np.float32) for m in sizes[1:]]
+        self.moments = [np.zeros_like(p) for p in self.parameters()]
+        self.squares = [np.zeros_like(p) for p in self.parameters()]
+        self.updates = 0
+
+    def parameters(self):
+        return self.weights + self.biases
+
+    def setParameters(self, parameters):
+        n = len(self.weights)
+        self.weights = [p.copy() for p in parameters[:n]]
+        self.biases = [p.copy() for p in parameters[n:]]
+
+    def forward(self, x):
+        activations = [x]
+        for W, b in zip(self.weights[:-1], self.biases[:-1]):
+            x = np.maximum(x @ W + b, 0)
+            activations.append(x)
+        return x @ self.weights[-1] + self.biases[-1], activations
+
+    def train(self, x, actions, targets):
+        outputs, activations = self.forward(x)
+        rows = np.arange(len(x))
+        errors = np.clip(outputs[rows, actions] - targets, -1, 1)  # Huber loss gradient
+        delta = np.zeros_like(outputs)
+        delta[rows, actions] = errors / len(x)
+
+        gradients = []
+        for layer in reversed(range(len(self.weights))):
+            gradients.append((activations[layer].T @ delta, delta.sum(axis=0)))
+            if layer:
+                delta = (delta @ self.weights[layer].T) * (activations[layer] > 0)
+        gradients = [g for g, _ in reversed(gradients)] + [g for _, g in reversed(gradients)]
+
+        self.updates += 1
+        correction = np.sqrt(1 - 0.999 ** self.updates) / (1 - 0.9 ** self.updates)
+        for p, g, m, v in zip(self.parameters(), gradients, self.moments, self.squares):
+            m *= 0.9
+            m += 0.1 * g
+            v *= 0.999
+            v += 0.001 * g * g
+            p -= self.learningRate * correction * m / (np.sqrt(v) + 1e-8)
+        return float(np.abs(errors).mean())
+
+
+class DQNAgent:
+    # Deep Q-network on a fixed-size observation of the grid (N_PLANES planes of w * h cells,
+    # see observe) with a target network and experience replay. Plugs into Environment.runStep
+    # like RLAgent (one minibatch update every trainEvery learner steps), or is trained on
+    # VectorEnvironment copies with trainVector, where acting is also batched. Rewards are
+    # scaled by rewardScale so Q-values stay around 1.
+    def __init__(self, environment, id=0, hidden=(128, 64), batchSize: int=64, bufferSize: int=50000,
+                 trainEvery: int=4, targetEvery: int=500, learningRate: float=3e-4, rewardScale: float=0.01, seed=None):
+        self.id = id
+        self.environment = environment
+        self.nCells = environment.w * environment.h
+        self.rng = np.random.default_rng(seed)
+        self.network = MLP([N_PLANES * self.nCells, *hidden, N_ACTIONS], self.rng, learningRate)
+        self.target = MLP([N_PLANES * self.nCells, *hidden, N_ACTIONS], self.rng)
+        self.target.setParameters(self.network.parameters())
+
+        self.steps = 0
+        self.epsilonSchedule = ExponentialSchedule(1.0, 0.99995, minimum=0.05)
+        self.gammaSchedule = ConstantSchedule(0.99)
+        self.batchSize = batchSize
+        self.trainEvery = trainEvery
+        self.targetEvery = targetEvery
+        self.rewardScale = rewardScale
+        self.loss = 0
+
+        # Walls and hospitals never change, the other planes are written over a copy of them
+        self.static = np.zeros((N_PLANES, self.nCells), dtype=np.uint8)
+        for column in environment.cellGrid:
+            for cell in column:
+                index = cell.x * environment.h + cell.y
+                for orientation in cell.openOrientations:
+                    self.static[ROADS + orientation, index] = 1
+                self.static[HOSPITALS, index] = cell.hospitalFlag.index != -1
+
+        # Replay ring of uint8 observations
+        self.bufferSize = bufferSize
+        self.observations = np.zeros((bufferSize, N_PLANES * self.nCells), dtype=np.uint8)
+        self.actions = np.zeros(bufferSize, dtype=np.int8)
+        self.rewards = np.zeros(bufferSize, dtype=np.float32)
+        self.nextObservations = np.zeros((bufferSize, N_PLANES * self.nCells), dtype=np.uint8)
+        self.nextLegal = np.zeros((bufferSize, N_ACTIONS), dtype=bool)
+        self.finals = np.zeros(bufferSize, dtype=bool)
+        self.size = 0
+        self.position = 0
+
+        self.lastState = None
+        self.lastObservation = None
+
+    @property
+    def epsilon(self):
+        return self.epsilonSchedule.value(self.steps)
+
+    @epsilon.setter
+    def epsilon(self, value):
+        self.epsilonSchedule = ExponentialSchedule(value, self.epsilonSchedule.decay, self.steps, self.epsilonSchedule.minimum)
+
+    @property
+    def gamma(self):
+        return self.gammaSchedule.value(self.steps)
+
+    def observe(self):
+        # Observation of the environment's current grid, from its incremental indexes
+        environment = self.environment
+        planes = self.static.copy()
+        for cell in environment.victimCells.values():
+            planes[VICTIMS, cell.x * environment.h + cell.y] = 1
+        for agentId, cell in environment.agentCells.items():
+            index = cell.x * environment.h + cell.y
+            if agentId == self.id:
+                planes[POSITION, index] = 1
+                planes[ORIENTATIONS + cell.agentFlag.orientation, index] = 1
+                planes[INVENTORY, index] = len(cell.agentFlag.inventory)
+            else:
+                planes[OTHERS, index] = 1
+        return planes.reshape(-1)
+
+    def observeVector(self, vector):
+        # Observations of all the copies of a VectorEnvironment of the same map, [n, N_PLANES * w * h]
+        n = vector.n
+        rows = np.arange(n)
+        slot = vector.agentSlots[self.id]
+        cell = vector.agentCell[:, slot]
+        planes = np.repeat(self.static[None], n, axis=0)
+        planes[:, VICTIMS] = vector.victims[:, None] & vector.victimBitAt[None] != 0
+        planes[rows, POSITION, cell] = 1
+        planes[rows, ORIENTATIONS + vector.agentOrientation[:, slot], cell] = 1
+        planes[rows, INVENTORY, cell] = vector.inventoryCount[:, slot]
+        for otherSlot in range(vector.nAgents):
+            if otherSlot != slot:
+                planes[rows, OTHERS, vector.agentCell[:, otherSlot]] = 1
+        return planes.reshape(n, -1)
+
+    def getValues(self, observations, network=None):
+        return (self.network if network is None else network).forward(observations.astype(np.float32))[0]
+
+    def getBestPolicy(self, state, legalActions=None):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        self.lastState, self.lastObservation = state, self.observe()
+        values = self.getValues(self.lastObservation[None])[0]
+        return max(legalActions, key=lambda a: values[a])
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        if forceExplore or rd.random() < self.epsilonSchedule.value(self.steps):
+            self.lastState, self.lastObservation = state, self.observe()
+            return rd.choice(legalActions)
+        return self.getBestPolicy(state, legalActions)
+
+    def selectActions(self, observations, legal):
+        # Batched epsilon-greedy over rows of observations with [n, N_ACTIONS] legal masks
+        values = np.where(legal, self.getValues(observations), -np.inf)
+        actions = values.argmax(axis=1)
+        explore = self.rng.random(len(legal)) < self.epsilonSchedule.value(self.steps)
+        if explore.any():
+            scores = self.rng.random((int(explore.sum()), N_ACTIONS))
+            scores[~legal[explore]] = -1
+            actions[explore] = scores.argmax(axis=1)
+        return actions
+
+    def store(self, observations, actions, rewards, nextObservations, nextLegal, finals):
+        indices = (self.position + np.arange(len(actions))) % self.bufferSize
+        self.observations[indices] = observations
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.nextObservations[indices] = nextObservations
+        self.nextLegal[indices] = nextLegal
+        self.finals[indices] = finals
+        self.position = (self.position + len(actions)) % self.bufferSize
+        self.size = min(self.size + len(actions), self.bufferSize)
+
+    def update(self):
+        # One minibatch step towards r + gamma * Qtarget(s', a*) with a* the best legal action
+        # of the online network (double DQN, the target network alone overestimates)
+        if self.size < self.batchSize:
+            return
+        indices = self.rng.integers(0, self.size, self.batchSize)
+        nextObservations = self.nextObservations[indices].astype(np.float32)
+        nextLegal = self.nextLegal[indices]
+        nextActions = np.where(nextLegal, self.network.forward(nextObservations)[0], -np.inf).argmax(axis=1)
+        nextValues = self.target.forward(nextObservations)[0][np.arange(self.batchSize), nextActions]
+        nextValues[self.finals[indices] | ~nextLegal.any(axis=1)] = 0
+        targets = self.rewardScale * self.rewards[indices] + self.gammaSchedule.value(self.steps) * nextValues
+        self.loss = self.network.train(self.observations[indices].astype(np.float32), self.actions[indices], targets)
+        if self.network.updates % self.targetEvery == 0:
+            self.target.setParameters(self.network.parameters())
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        if old_state != self.lastState:
+            return  # the action wasn't chosen by this agent, its observation is unknown
+        nextLegal = np.zeros((1, N_ACTIONS), dtype=bool)
+        if not final:
+            nextLegal[0, self.environment.getLegalActions(self.id) if legalActions is None else legalActions] = True
+        self.store(self.lastObservation[None], [actionDone], [reward], self.observe()[None], nextLegal, [final])
+        self.lastState = None
+
+        self.steps += 1
+        if self.steps % self.trainEvery == 0:
+            self.update()
+
+    def trainVector(self, vector, ticks, walkerId=1):
+        # Every tick the learner acts in all the copies with one forward pass, then the random
+        # walker; each tick adds vector.n transitions and vector.n / trainEvery updates. The
+        # transitions cut by the step cap are dropped: their next grid is the reset one.
+        updates = 0
+        for _ in range(ticks):
+            observations = self.observeVector(vector)
+            actions = self.selectActions(observations, vector.getLegalActions(self.id))
+            rewards, final, done = vector.runStep(self.id, actions)
+            kept = final | ~done
+            nextLegal = vector.getLegalActions(self.id)
+            nextLegal[final] = False
+            self.store(observations[kept], actions[kept], rewards[kept], self.observeVector(vector)[kept], nextLegal[kept], final[kept])
+            vector.runStep(walkerId, vector.walkerActions(walkerId))
+
+            self.steps += vector.n
+            updates += vector.n / self.trainEvery
+            while updates >= 1:
+                self.update()
+                updates -= 1
+
+    def save(self, path, background=False):
+        with open(path, 'wb') as file:
+            np.savez(file, *self.network.parameters())
+
+    def load(self, path, mmap=False):
+        with np.load(path) as parameters:
+            self.network.setParameters([parameters['arr_%d' % i] for i in range(len(parameters.files))])
+        self.target.setParameters(self.network.parameters())
@@ -1,14 +1,11 @@
 from __future__ import annotations
-from colorama import Fore, Back
 from enum import IntEnum
 import random as rd
-from typing import List
-import copy as cp
-import time
-
-from rlagent import RLAgent
+from time import perf_counter
 
 saved = 0
+MAX_STEPS = 150
+MAX_TICKS = MAX_STEPS // 2  # runTick: every agent acts once per tick, two agents with runStep make 150 steps
 
 
 class Action(IntEnum):
@@ -27,54 +24,92 @@ class Orientation(IntEnum):
     LEFT = 3
 
     def getOffset(self) -> tuple[int, int]:
-        if self == Orientation.UP:
-            return 0, -1
-        if self == Orientation.RIGHT:
-            return +1, 0
-        if self == Orientation.DOWN:
-            return 0, +1
-        if self == Orientation.LEFT:
-            return -1, 0
+        return OFFSETS[self]
 
     def getLeft(self) -> Orientation:
-        return Orientation((int(self) - 1)%4)
+        return LEFTS[self]
 
     def getRight(self) -> Orientation:
-        return Orientation((int(self) + 1)%4)
+        return RIGHTS[self]
+
+
+OFFSETS = ((0, -1), (+1, 0), (0, +1), (-1, 0))
+# Turns looked up instead of building an enum member on every LEFT or RIGHT action
+LEFTS = tuple(Orientation((orientation - 1) % 4) for orientation in range(4))
+RIGHTS = tuple(Orientation((orientation + 1) % 4) for orientation in range(4))
+
+
+# Glyphs of the rendered roads by mask of open orientations (U, R, D, L bits), '•' otherwise
+ROAD_GLYPHS = {
+    0b0101: '┃', 0b1010: '━', 0b0110: '┏', 0b1100: '┓', 0b0011: '┗', 0b1001: '┛',
+    0b0111: '┣', 0b1101: '┫', 0b1011: '┻', 0b1110: '┳', 0b1111: '╋',
+}
+AGENT_GLYPHS = ('▲', '▶', '▼', '◀')
+
 
+def toMask(openOrientations):
+    mask = 0
+    for orientation in openOrientations:
+        mask |= 1 << orientation
+    return mask
 
+
+def toOrientations(mask):
+    return {orientation for orientation in Orientation if mask >> orientation & 1}
+
+
+# Cells and flags use __slots__ so large grids and many environment copies stay small; an
+# empty inventory is the shared empty tuple
 class AgentFlag:
-    def __init__(self, index: int=-1, orientation: Orientation=Orientation.UP, inventory: List[int]=[]):
+    __slots__ = ("index", "orientation", "inventory")
+
+    def __init__(self, index: int=-1, orientation: Orientation=Orientation.UP, inventory: tuple=()):
         self.index = index
         self.orientation = orientation
         self.inventory = inventory
 
 
 class HospitalFlag:
+    __slots__ = ("index",)
+
     def __init__(self, index: int=-1):
         self.index = index
 
 
 class StartFlag:
+    __slots__ = ("index", "orientation")
+
     def __init__(self, index: int=-1, orientation: Orientation=Orientation.UP):
         self.index = index
         self.orientation = orientation
 
 
 class VictimFlag:
+    __slots__ = ("index",)
+
     def __init__(self, index: int=-1):
         self.index = index
 
 
 class Cell:
-    def __init__(self, x, y, agentIndex: int=-1, agentOrientation: Orientation=Orientation.UP, agentInventory: List[int]=[], hospitalIndex: int=-1, startIndex: int=-1, startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]={}):
+    __slots__ = ("x", "y", "agentFlag", "hospitalFlag", "startFlag", "victimFlag", "openMask")
+
+    def __init__(self, x, y, agentIndex: int=-1, agentOrientation: Orientation=Orientation.UP, agentInventory: tuple=(), hospitalIndex: int=-1, startIndex: int=-1, startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]=()):
         self.x = x
         self.y = y
-        self.agentFlag = AgentFlag(agentIndex, agentOrientation, agentInventory)
+        self.agentFlag = AgentFlag(agentIndex, agentOrientation, tuple(agentInventory))
         self.hospitalFlag = HospitalFlag(hospitalIndex)
         self.startFlag = StartFlag(startIndex, startOrientation)
         self.victimFlag = VictimFlag(victimIndex)
-        self.openOrientations = openOrientations
+        self.openMask = toMask(openOrientations)  # bit o set when orientation o leads to a road
+
+    @property
+    def openOrientations(self) -> set[Orientation]:
+        return toOrientations(self.openMask)
+
+    @openOrientations.setter
+    def openOrientations(self, openOrientations):
+        self.openMask = toMask(openOrientations)
 
     def __repr__(self):
         result = '(' + str(self.x) + ', ' + str(self.y) + ', '
@@ -86,6 +121,8 @@ class Cell:
         return result
 
     def __str__(self):
+        from colorama import Fore, Back  # only needed for rendering
+
         background = Back.BLACK
         foreground = Fore.WHITE
 
@@ -101,92 +138,334 @@ class Cell:
         if len(self.agentFlag.inventory) == 2:
             foreground = Fore.RED
 
-        if self.openOrientations == {Orientation.UP, Orientation.DOWN}:
-            result = '┃'
-        elif self.openOrientations == {Orientation.LEFT, Orientation.RIGHT}:
-            result = '━'
-
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.DOWN}:
-            result = '┏'
-        elif self.openOrientations == {Orientation.LEFT, Orientation.DOWN}:
-            result = '┓'
-        elif self.openOrientations == {Orientation.UP, Orientation.RIGHT}:
-            result = '┗'
-        elif self.openOrientations == {Orientation.UP, Orientation.LEFT}:
-            result = '┛'
-
-        elif self.openOrientations == {Orientation.UP, Orientation.DOWN, Orientation.RIGHT}:
-            result = '┣'
-        elif self.openOrientations == {Orientation.UP, Orientation.DOWN, Orientation.LEFT}:
-            result = '┫'
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.LEFT, Orientation.UP}:
-            result = '┻'
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.LEFT, Orientation.DOWN}:
-            result = '┳'
-        
-        else:
-            result = '•'
+        result = ROAD_GLYPHS.get(self.openMask, '•')
 
         if self.agentFlag.index != -1:
-            if self.agentFlag.orientation == Orientation.UP:
-                result = '▲'
-            elif self.agentFlag.orientation == Orientation.RIGHT:
-                result = '▶'
-            elif self.agentFlag.orientation == Orientation.DOWN:
-                result = '▼'
-            elif self.agentFlag.orientation == Orientation.LEFT:
-                result = '◀'
+            result = AGENT_GLYPHS[self.agentFlag.orientation]
         
         return background + foreground + result + Back.BLACK + Fore.WHITE
 
 
+class StateEncoder:
+    # Packs the dynamic part of the grid (agent positions, orientations, inventories and the
+    # victims still on the ground) into a single int. Walls and hospitals never change so they
+    # are left out of the key.
+    def __init__(self, environment):
+        self.h = environment.h
+        self.nCells = environment.w * environment.h
+
+        agentIds = []
+        victimIds = []
+        self.victimHomes = {}  # victims only ever lie on their starting cell
+        for column in environment.cellGrid:
+            for cell in column:
+                if cell.agentFlag.index != -1:
+                    agentIds.append(cell.agentFlag.index)
+                    victimIds += cell.agentFlag.inventory
+                if cell.victimFlag.index != -1:
+                    victimIds.append(cell.victimFlag.index)
+                    self.victimHomes[cell.victimFlag.index] = (cell.x, cell.y)
+
+        self.agentIds = sorted(agentIds)
+        self.victimIds = sorted(victimIds)
+        self.victimBits = {victimId: 1 << i for i, victimId in enumerate(self.victimIds)}
+        self.nVictims = len(self.victimIds)
+        self.victimSets = {}  # mask -> victim ids, filled by decode as masks show up
+        self.orientations = tuple(Orientation)
+
+    def inventoryMask(self, inventory):
+        mask = 0
+        for victimId in inventory:
+            mask |= self.victimBits[victimId]
+        return mask
+
+    def encode(self, environment):
+        groundMask = 0
+        for victimId in environment.victimCells:
+            groundMask |= self.victimBits[victimId]
+
+        key = 0
+        for agentId in self.agentIds:
+            cell = environment.agentCells[agentId]
+            key = (key * self.nCells + cell.x * self.h + cell.y) * 4 + cell.agentFlag.orientation
+            key = (key << self.nVictims) | self.inventoryMask(cell.agentFlag.inventory)
+
+        return (key << self.nVictims) | groundMask
+
+    def getVictims(self, mask):
+        victims = self.victimSets.get(mask)
+        if victims is None:
+            victims = self.victimSets[mask] = tuple(victimId for victimId in self.victimIds if mask & self.victimBits[victimId])
+        return victims
+
+    def decode(self, key):
+        # Inverse of encode: ({agentId: (x, y, orientation, inventory)}, victims on the ground)
+        victimMask = (1 << self.nVictims) - 1
+        ground = self.getVictims(key & victimMask)
+        key >>= self.nVictims
+
+        agents = {}
+        for agentId in reversed(self.agentIds):
+            inventory = self.getVictims(key & victimMask)
+            key >>= self.nVictims
+            key, orientation = divmod(key, 4)
+            key, cellIndex = divmod(key, self.nCells)
+            agents[agentId] = (cellIndex // self.h, cellIndex % self.h, self.orientations[orientation], inventory)
+        return agents, ground
+
+
+class ZobristEncoder:
+    # Incremental alternative to StateEncoder: one random 64-bit number per (agent, cell,
+    # orientation), per (agent, carried victim) and per victim on the ground, and a state
+    # hashes to the XOR of its features. Every action changes at most a few features, so the
+    # environment updates the key in O(1) instead of encoding the grid again. Unlike StateEncoder
+    # keys, two states can collide (see benchmark.py --collisions) and keys can't be decoded.
+    def __init__(self, environment, seed: int=0):
+        random = rd.Random(seed)
+        nNodes = environment.w * environment.h * 4
+        self.h = environment.h
+        self.positions = {agentId: [random.getrandbits(64) for _ in range(nNodes)] for agentId in environment.encoder.agentIds}
+        self.carried = {agentId: {victimId: random.getrandbits(64) for victimId in environment.encoder.victimIds}
+                        for agentId in environment.encoder.agentIds}
+        self.ground = {victimId: random.getrandbits(64) for victimId in environment.encoder.victimIds}
+
+    def encode(self, environment):
+        key = 0
+        for victimId in environment.victimCells:
+            key ^= self.ground[victimId]
+        for agentId, cell in environment.agentCells.items():
+            key ^= self.positions[agentId][(cell.x * self.h + cell.y) * 4 + cell.agentFlag.orientation]
+            for victimId in cell.agentFlag.inventory:
+                key ^= self.carried[agentId][victimId]
+        return key
+
+
+class StateAbstraction:
+    # Canonical keys of the grid as seen by the learner agentId, used instead of the exact
+    # StateEncoder keys so that equivalent states share their Q-values:
+    # - inventoryCount: inventories are encoded by their size, not by which victims they hold;
+    #   victims are interchangeable for the rewards, so no information is lost
+    # - radius: the other agents and the victims on the ground are only seen within this
+    #   Manhattan distance of the learner, farther ones are all encoded alike
+    # - otherOrientations=False: the other agents' orientations are left out
+    # The last two alias states that behave differently, trading accuracy for a smaller table.
+    def __init__(self, environment, agentId: int=0, inventoryCount: bool=False, radius=None, otherOrientations: bool=True):
+        encoder = environment.encoder
+        self.agentId = agentId
+        self.inventoryCount = inventoryCount
+        self.radius = radius
+        self.otherOrientations = otherOrientations
+        self.h = environment.h
+        self.nCells = environment.w * environment.h
+        self.agentIds = [agentId] + [otherId for otherId in encoder.agentIds if otherId != agentId]
+        self.victimBits = encoder.victimBits
+        self.victimHomes = encoder.victimHomes
+        self.nVictims = encoder.nVictims
+        self.inventoryMask = encoder.inventoryMask
+        self.inventoryRadix = self.nVictims + 1 if inventoryCount else 1 << self.nVictims
+
+    def isVisible(self, learner, x, y):
+        return self.radius is None or abs(x - learner.x) + abs(y - learner.y) <= self.radius
+
+    def encode(self, environment):
+        learner = environment.agentCells[self.agentId]
+        key = 0
+        for agentId in self.agentIds:
+            cell = environment.agentCells[agentId]
+            if agentId != self.agentId and not self.isVisible(learner, cell.x, cell.y):
+                key = (key * (self.nCells + 1) + self.nCells) * 4 * self.inventoryRadix  # out of sight
+                continue
+
+            orientation = cell.agentFlag.orientation if agentId == self.agentId or self.otherOrientations else 0
+            inventory = cell.agentFlag.inventory
+            key = (key * (self.nCells + 1) + cell.x * self.h + cell.y) * 4 + orientation
+            key = key * self.inventoryRadix + (len(inventory) if self.inventoryCount else self.inventoryMask(inventory))
+
+        groundMask = 0
+        for victimId in environment.victimCells:
+            if self.isVisible(learner, *self.victimHomes[victimId]):
+                groundMask |= self.victimBits[victimId]
+        return (key << self.nVictims) | groundMask
+
+
 class Environment:
-    def __init__(self, w: int=5, h: int=5):
+    def __init__(self, w: int=5, h: int=5, gameMap=None):
+        # With a gameMap (see maps.py) reset() applies it instead of the hard-coded 5x5 map
+        if gameMap is not None:
+            w, h = gameMap.w, gameMap.h
         self.w = w
         self.h = h
+        self.gameMap = gameMap
         self.cellGrid = [[Cell(x, y) for y in range(h)] for x in range(w)]
         self.saved = 0
         self.step = 0
+        self.encoder = None
+        self.zobrist = None  # ZobristEncoder once enableHashing() is called
+        self.abstraction = None  # StateAbstraction once enableAbstraction() is called
+        self.currentState = None
+        self.shaping = None  # optional potential (e.g. DistanceField) added to the learner's reward
+        self.telemetry = None  # optional Telemetry fed by runStep
+        self.failPenalty = 0  # subtracted from the reward of an action that failed
+        self.walkerPicks = True  # the walker picks and drops whenever it can, else it's uniform
+
+        # Incremental indexes kept up to date by setCell, _moveOrientation, doPick and doDrop
+        self.agentCells = {}
+        self.victimCells = {}
+        self.victimCount = 0
+        self.carriedCount = 0
+        self.victimChanges = 0  # incremented whenever the set of victims on the ground changes
+
+        # Lookup tables compiled from the walls, indexed by cellIndex * 4 + orientation
+        self.neighbours = None
+        self.moves = None
+        self.wallChanges = 0  # incremented whenever setCell changes the walls of a cell
+        self.appliedWalls = None  # wallChanges when gameMap last set every cell, see Map.apply
+
+    def getState(self):
+        # Cached until the next mutation, so consecutive runStep calls encode each state once;
+        # with hashing the cached key is updated by every action instead
+        if self.currentState is None:
+            if self.abstraction is not None:
+                self.currentState = self.abstraction.encode(self)
+            else:
+                self.currentState = (self.encoder if self.zobrist is None else self.zobrist).encode(self)
+        return self.currentState
+
+    def enableHashing(self, seed: int=0):
+        # Use incremental Zobrist hashes as state keys from now on (call after reset())
+        if self.abstraction is not None:
+            raise ValueError("Zobrist hashing can't be combined with a state abstraction")
+        self.zobrist = ZobristEncoder(self, seed)
+        self.currentState = None
+
+    def enableAbstraction(self, agentId: int=0, inventoryCount: bool=False, radius=None, otherOrientations: bool=True):
+        # Use the canonical keys of a StateAbstraction from now on (call after reset())
+        if self.zobrist is not None:
+            raise ValueError("a state abstraction can't be combined with Zobrist hashing")
+        self.abstraction = StateAbstraction(self, agentId, inventoryCount, radius, otherOrientations)
+        self.currentState = None
 
     def runStep(self, agent, idiotDuVillage=False):
-        state = repr(self)
-        action = Action.NONE
+        telemetry = None if idiotDuVillage else self.telemetry
+        timed = telemetry is not None and telemetry.timeNext()
+        if timed: t0 = perf_counter()
+        state = self.getState()
+        legalActions = self.getLegalActions(agent.id)
         if idiotDuVillage:
-            agentCell = self._getCellAgent(agent.id)
-            #action = rd.choice([x for x in self.getLegalActions(agent.id) if x in [Action.LEFT, Action.MOVE, Action.RIGHT]] + [Action.NONE])
-            action = rd.choice(self.getLegalActions(agent.id))
-            if agentCell.victimFlag.index != -1:
-                if len(agentCell.agentFlag.inventory) < 2:
-                    action = Action.PICK
-            elif agentCell.hospitalFlag.index != -1:
-                if len(agentCell.agentFlag.inventory) > 0:
-                    action = Action.DROP
+            action = self.getWalkerAction(agent.id, legalActions)
         else:
-            action = agent.selectAction(state, self.getLegalActions(agent.id))
+            if timed: t1 = perf_counter()
+            action = agent.selectAction(state, legalActions)
+            if timed: t2 = perf_counter()
+            if self.shaping is not None:
+                potential = self.shaping.potential(agent.id)
         reward = self.doAction(agent.id, action)
-        
-        old_state = cp.deepcopy(state)
-        state = repr(self)
+
         final = self.isFinal()
-        agent.updateQValues(old_state, action, state, reward, final)
+        if not idiotDuVillage:
+            if self.shaping is not None:
+                # Potential-based shaping F = gamma * phi(s') - phi(s), with phi = 0 once final
+                reward += (0 if final else self.shaping.gamma * self.shaping.potential(agent.id)) - potential
+            if timed: t3 = perf_counter()
+            agent.updateQValues(state, action, self.getState(), reward, final, None if final else self.getLegalActions(agent.id))
+            if telemetry is not None:
+                if timed: telemetry.addTimes(t1 - t0 + t3 - t2, t2 - t1, perf_counter() - t3)
+                telemetry.record(reward)
+
+        if final or self.step == MAX_STEPS:
+            if self.telemetry is not None:
+                self.telemetry.endEpisode(self.saved)
+            self.reset()
 
-        if final or self.step == 150: self.reset()
+        self.step += 1
+
+    def runTick(self, agents, maxTicks: int=MAX_TICKS):
+        # Every agent acts at once: the state is encoded, finality checked and the grid reset
+        # once per tick whatever the number of agents. Scripted agents (WalkerAgent,
+        # HeuristicAgent) have a no-op updateQValues.
+        state = self.getState()
+        actions = {}
+        potentials = {}
+        for agent in agents:
+            actions[agent.id] = agent.selectAction(state, self.getLegalActions(agent.id))
+            if self.shaping is not None:
+                potentials[agent.id] = self.shaping.potential(agent.id)
+        rewards = self.doActions(actions)
+
+        nextState = self.getState()
+        final = self.isFinal()
+        for agent in agents:
+            reward = rewards[agent.id]
+            if self.shaping is not None:
+                reward += (0 if final else self.shaping.gamma * self.shaping.potential(agent.id)) - potentials[agent.id]
+            agent.updateQValues(state, actions[agent.id], nextState, reward, final)
+
+        if final or self.step == maxTicks: self.reset()
 
         self.step += 1
+        return rewards, final
+
+    def getWalkerAction(self, agentId, legalActions=None):
+        # Random walker standing in for the human-driven robot: picks and drops whenever it
+        # can (unless walkerPicks is off), otherwise plays a random legal action
+        #action = rd.choice([x for x in self.getLegalActions(agentId) if x in [Action.LEFT, Action.MOVE, Action.RIGHT]] + [Action.NONE])
+        action = rd.choice(self.getLegalActions(agentId) if legalActions is None else legalActions)
+        forcedAction = self._getWalkerForcedAction(agentId)
+        return action if forcedAction is None else forcedAction
+
+    def getWalkerActions(self, agentId, legalActions=None):
+        # The equally likely actions of getWalkerAction, for planning
+        forcedAction = self._getWalkerForcedAction(agentId)
+        if forcedAction is not None:
+            return [forcedAction]
+        return self.getLegalActions(agentId) if legalActions is None else legalActions
+
+    def _getWalkerForcedAction(self, agentId):
+        if not self.walkerPicks:
+            return None
+        agentCell = self._getCellAgent(agentId)
+        if agentCell.victimFlag.index != -1:
+            if len(agentCell.agentFlag.inventory) < 2:
+                return Action.PICK
+        elif agentCell.hospitalFlag.index != -1:
+            if len(agentCell.agentFlag.inventory) > 0:
+                return Action.DROP
+        return None
+
+    def compile(self):
+        # The walls are static, so neighbours and the LEFT/MOVE/RIGHT transitions of every
+        # (cell, orientation) pair are computed once per map instead of on every step
+        self.neighbours = [None] * (self.w * self.h * 4)
+        self.moves = [None] * (self.w * self.h * 4)
+        for column in self.cellGrid:
+            for cell in column:
+                self.compileCell(cell)
+
+    def compileCell(self, cell):
+        # Both tables of a cell only depend on its own walls, see setCell
+        index = cell.x * self.h + cell.y
+        for orientation in Orientation:
+            nextCell = None
+            if cell.openMask >> orientation & 1:
+                deltaX, deltaY = OFFSETS[orientation]
+                nextCell = self.cellGrid[cell.x + deltaX][cell.y + deltaY]
+            self.neighbours[index * 4 + orientation] = nextCell
+
+        for orientation in Orientation:
+            moves = []
+            for action, nextOrientation in ((Action.LEFT, orientation.getLeft()), (Action.MOVE, orientation), (Action.RIGHT, orientation.getRight())):
+                nextCell = self.neighbours[index * 4 + nextOrientation]
+                if nextCell is not None:
+                    moves.append((action, nextOrientation, nextCell))
+            self.moves[index * 4 + orientation] = tuple(moves)
 
     def getLegalActions(self, agentId):
-        agentCell = self._getCellAgent(agentId)
+        agentCell = self.agentCells[agentId]
 
         legalActions = [Action.NONE]
-        if agentCell.agentFlag.orientation.getLeft() in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation.getLeft()).agentFlag.index == -1:
-            legalActions += [Action.LEFT]
-        if agentCell.agentFlag.orientation in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation).agentFlag.index == -1:
-            legalActions += [Action.MOVE]
-        if agentCell.agentFlag.orientation.getRight() in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation.getRight()).agentFlag.index == -1:
-            legalActions += [Action.RIGHT]
+        for action, _, nextCell in self.moves[(agentCell.x * self.h + agentCell.y) * 4 + agentCell.agentFlag.orientation]:
+            if nextCell.agentFlag.index == -1:
+                legalActions.append(action)
         if agentCell.victimFlag.index != -1 and len(agentCell.agentFlag.inventory) < 2:
             legalActions += [Action.PICK]
         if agentCell.hospitalFlag.index != -1 and len(agentCell.agentFlag.inventory) > 0:
@@ -195,11 +474,23 @@ class Environment:
         return legalActions
 
     def setCell(self, x, y, agentIndex: int=-1, agentOrientation: Orientation=Orientation.UP,
-                agentInventory=[], hospitalIndex: int=-1, startIndex: int=-1,
-                startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]={}):
+                agentInventory=(), hospitalIndex: int=-1, startIndex: int=-1,
+                startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]=()):
+        cell = self.cellGrid[x][y]
+        self.currentState = None
+        openMask = toMask(openOrientations)
+        if cell.agentFlag.index != -1 and self.agentCells.get(cell.agentFlag.index) is cell:
+            del self.agentCells[cell.agentFlag.index]
+        self.carriedCount -= len(cell.agentFlag.inventory)
+        if cell.victimFlag.index != -1:
+            self.victimCount -= 1
+            if self.victimCells.get(cell.victimFlag.index) is cell:
+                del self.victimCells[cell.victimFlag.index]
+                self.victimChanges += 1
+
         self.cellGrid[x][y].agentFlag.index = agentIndex
         self.cellGrid[x][y].agentFlag.orientation = agentOrientation
-        self.cellGrid[x][y].agentFlag.inventory = [] if len(agentInventory) == 0 else agentInventory
+        self.cellGrid[x][y].agentFlag.inventory = tuple(agentInventory)
 
         self.cellGrid[x][y].hospitalFlag.index = hospitalIndex
 
@@ -208,28 +499,148 @@ class Environment:
 
         self.cellGrid[x][y].victimFlag.index = victimIndex
 
-        self.cellGrid[x][y].openOrientations = {} if len(openOrientations) == 0 else openOrientations
+        if cell.openMask != openMask:
+            cell.openMask = openMask
+            self.wallChanges += 1
+            if self.moves is not None:
+                self.compileCell(cell)
+
+        if agentIndex != -1:
+            self.agentCells[agentIndex] = cell
+        self.carriedCount += len(cell.agentFlag.inventory)
+        if victimIndex != -1:
+            self.victimCount += 1
+            self.victimCells[victimIndex] = cell
+            self.victimChanges += 1
+
+    def setState(self, state):
+        # Inverse of getState with exact keys: puts the agents, their inventories and the victims
+        # on the ground back as encoded in state (walls, hospitals, saved and step are left
+        # untouched). Only the agents and victims that differ from the current grid are touched.
+        agents, ground = self.encoder.decode(state)
+        moved = []
+        for agentId, (x, y, orientation, inventory) in agents.items():
+            cell = self.agentCells[agentId]
+            self.carriedCount += len(inventory) - len(cell.agentFlag.inventory)
+            if cell.x == x and cell.y == y:
+                cell.agentFlag.orientation = orientation
+                cell.agentFlag.inventory = inventory
+            else:
+                # Emptied first, another moved agent may be put back on this cell
+                cell.agentFlag.index = -1
+                cell.agentFlag.orientation = Orientation.UP
+                cell.agentFlag.inventory = ()
+                moved.append((agentId, self.cellGrid[x][y], orientation, inventory))
+        for agentId, cell, orientation, inventory in moved:
+            cell.agentFlag.index = agentId
+            cell.agentFlag.orientation = orientation
+            cell.agentFlag.inventory = inventory
+            self.agentCells[agentId] = cell
+
+        if len(ground) != self.victimCount or any(victimId not in self.victimCells for victimId in ground):
+            for victimId in [victimId for victimId in self.victimCells if victimId not in ground]:
+                self.victimCells.pop(victimId).victimFlag.index = -1
+            for victimId in ground:
+                if victimId not in self.victimCells:
+                    x, y = self.encoder.victimHomes[victimId]
+                    self.cellGrid[x][y].victimFlag.index = victimId
+                    self.victimCells[victimId] = self.cellGrid[x][y]
+            self.victimCount = len(ground)
+            self.victimChanges += 1
+        self.currentState = state if self.zobrist is None and self.abstraction is None else None
+
+    def snapshot(self):
+        # Dynamic state as a few ints: exact key, saved, step and the cached getState key (None
+        # if not computed), for search and lookahead rollouts (see restore)
+        state = self.currentState
+        exact = state if state is not None and self.zobrist is None and self.abstraction is None else self.encoder.encode(self)
+        return exact, self.saved, self.step, state
+
+    def restore(self, snapshot):
+        # Puts the grid back as it was at snapshot(), in O(agents + victims that changed)
+        exact, self.saved, self.step, state = snapshot
+        self.setState(exact)
+        self.currentState = state
 
     def doAction(self, agentId, action):
         if action == Action.LEFT:
             status, reward = self.doLeft(agentId)
-        if action == Action.MOVE:
+        elif action == Action.MOVE:
             status, reward = self.doMove(agentId)
-        if action == Action.RIGHT:
+        elif action == Action.RIGHT:
             status, reward = self.doRight(agentId)
-        if action == Action.PICK:
+        elif action == Action.PICK:
             status, reward = self.doPick(agentId)
-        if action == Action.DROP:
+        elif action == Action.DROP:
             status, reward = self.doDrop(agentId)
-        if action == Action.NONE:
+        elif action == Action.NONE:
             status, reward = self.doNone(agentId)
 
         if not status:
-            reward -= 10*0
+            reward -= self.failPenalty
         reward -= 1
 
         return reward
 
+    def doActions(self, actionsByAgent):
+        # Simultaneous version of doAction. Moves are resolved together: two agents heading
+        # for the same cell or swapping cells both stay, a move into a cell whose agent stays
+        # is blocked, and chains of agents following each other all move.
+        rewards = {}
+        targets = {}
+        for agentId, action in actionsByAgent.items():
+            if action == Action.LEFT or action == Action.MOVE or action == Action.RIGHT:
+                cell = self.agentCells[agentId]
+                orientation = cell.agentFlag.orientation
+                if action == Action.LEFT:
+                    orientation = orientation.getLeft()
+                elif action == Action.RIGHT:
+                    orientation = orientation.getRight()
+                nextCell = self.neighbours[(cell.x * self.h + cell.y) * 4 + orientation]
+                if nextCell is not None:
+                    targets[agentId] = (cell, orientation, nextCell)
+                rewards[agentId] = -1
+            else:
+                rewards[agentId] = self.doAction(agentId, action)
+
+        claims = {}
+        for _, _, nextCell in targets.values():
+            claims[nextCell] = claims.get(nextCell, 0) + 1
+        blocked = set()
+        for agentId, (cell, _, nextCell) in targets.items():
+            other = nextCell.agentFlag.index
+            if claims[nextCell] > 1 or (other in targets and targets[other][2] is cell):
+                blocked.add(agentId)
+        changed = True
+        while changed:
+            changed = False
+            for agentId, (_, _, nextCell) in targets.items():
+                other = nextCell.agentFlag.index
+                if agentId not in blocked and other != -1 and (other not in targets or other in blocked):
+                    blocked.add(agentId)
+                    changed = True
+
+        moving = [(agentId, targets[agentId]) for agentId in targets if agentId not in blocked]
+        previous = []
+        for agentId, (cell, _, _) in moving:
+            previous.append((cell.agentFlag.inventory, cell.agentFlag.orientation))
+            cell.agentFlag.index = -1
+            cell.agentFlag.orientation = Orientation.UP
+            cell.agentFlag.inventory = ()
+        for (agentId, (cell, orientation, nextCell)), (inventory, previousOrientation) in zip(moving, previous):
+            nextCell.agentFlag.index = agentId
+            nextCell.agentFlag.orientation = orientation
+            nextCell.agentFlag.inventory = inventory
+            self.agentCells[agentId] = nextCell
+            if self.zobrist is not None and self.currentState is not None:
+                positions = self.zobrist.positions[agentId]
+                self.currentState ^= positions[(cell.x * self.h + cell.y) * 4 + previousOrientation] ^ \
+                        positions[(nextCell.x * self.h + nextCell.y) * 4 + orientation]
+        if moving and self.zobrist is None:
+            self.currentState = None
+
+        return rewards
+
     def doLeft(self, agentId):
         agentCell = self._getCellAgent(agentId)
 
@@ -254,8 +665,16 @@ class Environment:
         if agentCell.victimFlag.index == -1:
             return False, 0
         
-        agentCell.agentFlag.inventory += [agentCell.victimFlag.index]
+        if self.zobrist is None:
+            self.currentState = None
+        elif self.currentState is not None:
+            self.currentState ^= self.zobrist.ground[agentCell.victimFlag.index] ^ self.zobrist.carried[agentId][agentCell.victimFlag.index]
+        agentCell.agentFlag.inventory += (agentCell.victimFlag.index,)
+        del self.victimCells[agentCell.victimFlag.index]
         agentCell.victimFlag.index = -1
+        self.victimCount -= 1
+        self.victimChanges += 1
+        self.carriedCount += 1
 
         return True, 50
 
@@ -268,72 +687,78 @@ class Environment:
         if nbVictim == 0:
             return False, 0
         
-        agentCell.agentFlag.inventory = []
+        if self.zobrist is None:
+            self.currentState = None
+        elif self.currentState is not None:
+            for victimId in agentCell.agentFlag.inventory:
+                self.currentState ^= self.zobrist.carried[agentId][victimId]
+        agentCell.agentFlag.inventory = ()
+        self.carriedCount -= nbVictim
         return True, nbVictim*100
     
     def doNone(self, agentId):
         return True, 0
     
     def isFinal(self):
-        for x in range(self.w):
-            for y in range(self.h):
-                if self.cellGrid[x][y].victimFlag.index != -1 or len(self.cellGrid[x][y].agentFlag.inventory) != 0:
-                    return False
-
-        return True
+        return self.victimCount == 0 and self.carriedCount == 0
 
     def reset(self):
         self.step = 0
-        self.setCell(0, 0, openOrientations={Orientation.DOWN, Orientation.RIGHT}, victimIndex=1)
-        self.setCell(1, 0, openOrientations={Orientation.LEFT, Orientation.RIGHT}, victimIndex=2)
-        self.setCell(2, 0, agentIndex=0, agentOrientation=Orientation.RIGHT, openOrientations={Orientation.LEFT, Orientation.DOWN, Orientation.RIGHT})
-        self.setCell(3, 0, openOrientations={Orientation.LEFT, Orientation.DOWN}, victimIndex=3)
-        self.setCell(4, 0, openOrientations={})
-
-        self.setCell(0, 1, openOrientations={Orientation.DOWN, Orientation.UP})
-        self.setCell(1, 1, openOrientations={})
-        self.setCell(2, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT}, victimIndex=4)
-        self.setCell(3, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.LEFT}, hospitalIndex=1)
-        self.setCell(4, 1, openOrientations={})
-
-        self.setCell(0, 2, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT})
-        self.setCell(1, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT})
-        self.setCell(2, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(3, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(4, 2, openOrientations={Orientation.LEFT, Orientation.DOWN})
-
-        self.setCell(0, 3, openOrientations={Orientation.UP, Orientation.DOWN})
-        self.setCell(1, 3, openOrientations={})
-        self.setCell(2, 3, openOrientations={Orientation.RIGHT, Orientation.DOWN})
-        self.setCell(3, 3, agentIndex=1, agentOrientation=Orientation.DOWN, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.DOWN}, hospitalIndex=2)
-        self.setCell(4, 3, openOrientations={Orientation.LEFT, Orientation.UP})
-
-        self.setCell(0, 4, openOrientations={Orientation.UP, Orientation.RIGHT})
-        self.setCell(1, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT}, victimIndex=5)
-        self.setCell(2, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(3, 4, openOrientations={Orientation.LEFT, Orientation.UP})
-        self.setCell(4, 4, openOrientations={})
+        if self.gameMap is not None:
+            self.gameMap.apply(self)
+        else:
+            self.setCell(0, 0, openOrientations={Orientation.DOWN, Orientation.RIGHT}, victimIndex=1)
+            self.setCell(1, 0, openOrientations={Orientation.LEFT, Orientation.RIGHT}, victimIndex=2)
+            self.setCell(2, 0, agentIndex=0, agentOrientation=Orientation.RIGHT, openOrientations={Orientation.LEFT, Orientation.DOWN, Orientation.RIGHT})
+            self.setCell(3, 0, openOrientations={Orientation.LEFT, Orientation.DOWN}, victimIndex=3)
+            self.setCell(4, 0, openOrientations={})
+
+            self.setCell(0, 1, openOrientations={Orientation.DOWN, Orientation.UP})
+            self.setCell(1, 1, openOrientations={})
+            self.setCell(2, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT}, victimIndex=4)
+            self.setCell(3, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.LEFT}, hospitalIndex=1)
+            self.setCell(4, 1, openOrientations={})
+
+            self.setCell(0, 2, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT})
+            self.setCell(1, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT})
+            self.setCell(2, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
+            self.setCell(3, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
+            self.setCell(4, 2, openOrientations={Orientation.LEFT, Orientation.DOWN})
+
+            self.setCell(0, 3, openOrientations={Orientation.UP, Orientation.DOWN})
+            self.setCell(1, 3, openOrientations={})
+            self.setCell(2, 3, openOrientations={Orientation.RIGHT, Orientation.DOWN})
+            self.setCell(3, 3, agentIndex=1, agentOrientation=Orientation.DOWN, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.DOWN}, hospitalIndex=2)
+            self.setCell(4, 3, openOrientations={Orientation.LEFT, Orientation.UP})
+
+            self.setCell(0, 4, openOrientations={Orientation.UP, Orientation.RIGHT})
+            self.setCell(1, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT}, victimIndex=5)
+            self.setCell(2, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
+            self.setCell(3, 4, openOrientations={Orientation.LEFT, Orientation.UP})
+            self.setCell(4, 4, openOrientations={})
+
+        if self.moves is None:
+            self.compile()
+        if self.encoder is None:
+            self.encoder = StateEncoder(self)
 
     def _getCellAgent(self, agentId):
-        # print("vvvvvvvvvvvvvvvvvvvvvv")
-        for x in range(self.w):
-            for y in range(self.h):
-                # print(self.cellGrid[x][y].agentFlag.index, "---", agentId)
-                if self.cellGrid[x][y].agentFlag.index == agentId:
-                    return self.cellGrid[x][y]
+        return self.agentCells.get(agentId)
     
     def simulateMove(self, cell, orientation):
-        if orientation not in cell.openOrientations:
-            return None
-        deltaX, deltaY = orientation.getOffset()
-        return self.cellGrid[cell.x + deltaX][cell.y + deltaY]
+        return self.neighbours[(cell.x * self.h + cell.y) * 4 + orientation]
 
     def _moveOrientation(self, orientation, cell):
-        if orientation not in cell.openOrientations:
+        newCell = self.neighbours[(cell.x * self.h + cell.y) * 4 + orientation]
+        if newCell is None:
             return False
 
-        deltaX, deltaY = orientation.getOffset()
-        newCell = self.cellGrid[cell.x + deltaX][cell.y + deltaY]
+        if self.zobrist is None:
+            self.currentState = None
+        elif self.currentState is not None:
+            positions = self.zobrist.positions[cell.agentFlag.index]
+            self.currentState ^= positions[(cell.x * self.h + cell.y) * 4 + cell.agentFlag.orientation] ^ \
+                    positions[(newCell.x * self.h + newCell.y) * 4 + orientation]
 
         newCell.agentFlag.index = cell.agentFlag.index
         newCell.agentFlag.orientation = orientation
@@ -341,7 +766,9 @@ class Environment:
 
         cell.agentFlag.index = -1
         cell.agentFlag.orientation = Orientation.UP
-        cell.agentFlag.inventory = []
+        cell.agentFlag.inventory = ()
+
+        self.agentCells[newCell.agentFlag.index] = newCell
 
         return True
 
@@ -359,26 +786,3 @@ class Environment:
                 result += str(self.cellGrid[x][y])
             result += "\n"
         return result
-    
-
-
-
-
-environment = Environment()
-environment.reset()
-agent = RLAgent(environment, 0)
-walker = RLAgent(environment, 1)
-
-agent = RLAgent(environment)
-for step in range(10000000):
-
-    if step <= 6000000:
-        if step % 10000 == 0:
-            print(step)
-    else:
-        time.sleep(0.3)
-        print("STEP:", step, "SAVED:", environment.saved, "VISITED:", str(len(agent.q)))
-        print(environment)
-
-    environment.runStep(agent)
-    environment.runStep(walker, True)
@@ -0,0 +1,132 @@
+import argparse
+import multiprocessing as mp
+import random as rd
+import time
+
+from environment import Environment, MAX_STEPS
+from maps import loadMap
+from qtable import QTable
+from rlagent import RLAgent
+
+_agent = None
+
+
+def runEpisode(environment, agent, walkerId=1, delay=None, stallTicks: int=10):
+    # Greedy episode without exploration nor Q updates, against the random walker of
+    # runStep(..., idiotDuVillage=True); with a delay the grid is rendered after every tick.
+    # The episode is deadlocked if the grid stayed unchanged for stallTicks ticks in a row
+    # (compared with exact keys: an abstract state can stay the same while the grid changes).
+    environment.reset()
+    saved = environment.saved
+    final = environment.isFinal()
+    stalled = 0
+    deadlock = False
+    while not final and environment.step < MAX_STEPS:
+        grid = environment.encoder.encode(environment)
+        for agentId in (agent.id, walkerId):
+            if agentId == agent.id:
+                action = agent.getBestPolicy(environment.getState(), environment.getLegalActions(agent.id))
+            else:
+                action = environment.getWalkerAction(walkerId)
+            environment.doAction(agentId, action)
+            environment.step += 1
+            final = environment.isFinal()
+            if final:
+                break
+
+        stalled = stalled + 1 if environment.encoder.encode(environment) == grid else 0
+        deadlock = deadlock or stalled >= stallTicks
+        if delay is not None:
+            print("STEP:", environment.step, "SAVED:", environment.saved - saved)
+            print(environment)
+            time.sleep(delay)
+
+    return {"saved": environment.saved - saved, "steps": environment.step, "final": final, "deadlock": deadlock}
+
+
+def _initWorker(agent):
+    global _agent
+    _agent = agent
+
+
+def _runEpisodes(args):
+    seed, episodes, walkerId = args
+    results = []
+    for episode in episodes:
+        # Every episode has its own seed, so results don't depend on the number of workers
+        rd.seed(seed * 1000003 + episode)
+        results.append(runEpisode(_agent.environment, _agent, walkerId))
+    return results
+
+
+def evaluate(agent, episodes: int=1000, workers: int=1, seed: int=0, walkerId: int=1, chunkSize: int=100):
+    # Runs seeded greedy episodes of agent (and its environment, copied to every worker
+    # process) and summarizes them, see summarize
+    chunks = [(seed, range(first, min(first + chunkSize, episodes)), walkerId) for first in range(0, episodes, chunkSize)]
+    if workers <= 1:
+        _initWorker(agent)
+        results = [result for chunk in chunks for result in _runEpisodes(chunk)]
+    else:
+        with mp.Pool(workers, _initWorker, (agent,)) as pool:
+            results = [result for chunkResults in pool.map(_runEpisodes, chunks) for result in chunkResults]
+    return summarize(results)
+
+
+def summarize(results):
+    episodes = len(results)
+    completedSteps = sorted(result["steps"] for result in results if result["final"])
+    savedDistribution = {}
+    for result in results:
+        savedDistribution[result["saved"]] = savedDistribution.get(result["saved"], 0) + 1
+
+    def percentile(values, p):
+        return values[min(int(p * len(values)), len(values) - 1)] if values else None
+
+    return {
+        "episodes": episodes,
+        "meanSaved": sum(result["saved"] for result in results) / max(episodes, 1),
+        "saved": dict(sorted(savedDistribution.items())),
+        "completed": len(completedSteps),
+        "stepsMean": sum(completedSteps) / len(completedSteps) if completedSteps else None,
+        "stepsMedian": percentile(completedSteps, 0.5),
+        "stepsP90": percentile(completedSteps, 0.9),
+        "timeouts": sum(not result["final"] for result in results) / max(episodes, 1),
+        "deadlocks": sum(result["deadlock"] for result in results) / max(episodes, 1),
+    }
+
+
+def printSummary(summary):
+    print("EPISODES:", summary["episodes"], "MEAN SAVED:", summary["meanSaved"], "COMPLETED:", summary["completed"])
+    print("SAVED:", ' '.join("%d:%d" % item for item in summary["saved"].items()))
+    if summary["completed"]:
+        print("STEPS TO COMPLETION: mean %.1f median %d p90 %d" % (summary["stepsMean"], summary["stepsMedian"], summary["stepsP90"]))
+    print("TIMEOUTS: %.3f DEADLOCKS: %.3f" % (summary["timeouts"], summary["deadlocks"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a saved Q-table with greedy seeded episodes")
+    parser.add_argument("snapshot", help="RLAgent snapshot (see RLAgent.save, main.py --checkpoint, planner.py)")
+    parser.add_argument("--map", default=None, help="map file (see maps.py) instead of the hard-coded 5x5 map")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hashing", type=int, default=None, metavar="SEED",
+                        help="the snapshot uses Zobrist keys (main.py --hashing) with this seed, i.e. main.py's --seed or 0")
+    parser.add_argument("--inventory-count", action="store_true", help="the snapshot uses abstract keys, see main.py")
+    parser.add_argument("--radius", type=int, default=None, help="the snapshot uses abstract keys, see main.py")
+    parser.add_argument("--no-other-orientations", action="store_true", help="the snapshot uses abstract keys, see main.py")
+    args = parser.parse_args()
+
+    environment = Environment(gameMap=loadMap(args.map) if args.map else None)
+    environment.reset()
+    if args.hashing is not None:
+        environment.enableHashing(args.hashing)
+    if args.inventory_count or args.radius is not None or args.no_other_orientations:
+        environment.enableAbstraction(0, args.inventory_count, args.radius, not args.no_other_orientations)
+    agent = RLAgent(environment, 0, QTable())
+    agent.load(args.snapshot)
+    printSummary(evaluate(agent, args.episodes, args.workers, args.seed))
+
+
+if __name__ == "__main__":
+    main()
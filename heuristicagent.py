@@ -0,0 +1,40 @@
+from environment import Action
+from distancefield import DistanceField
+
+
+class HeuristicAgent:
+    # Greedy baseline with the RLAgent interface: picks and drops whenever it can, otherwise
+    # takes the move that gets closest to the nearest victim (or hospital when carrying)
+    def __init__(self, environment, id=0, distanceField=None):
+        self.id = id
+        self.environment = environment
+        self.distanceField = DistanceField(environment) if distanceField is None else distanceField
+        self.epsilon = 0
+
+    def getBestPolicy(self, state, legalActions=None):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        if Action.PICK in legalActions:
+            return Action.PICK
+        if Action.DROP in legalActions:
+            return Action.DROP
+
+        environment = self.environment
+        agentCell = environment.agentCells[self.id]
+        carried = len(agentCell.agentFlag.inventory)
+        bestAction = Action.NONE
+        bestDistance = self.distanceField.getTargetDistance(agentCell, agentCell.agentFlag.orientation, carried)
+        for action, orientation, nextCell in environment.moves[self.distanceField.getNode(agentCell, agentCell.agentFlag.orientation)]:
+            if action in legalActions:
+                distance = self.distanceField.getTargetDistance(nextCell, orientation, carried)
+                if distance < bestDistance or bestAction == Action.NONE:
+                    bestAction = action
+                    bestDistance = distance
+
+        return bestAction
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        return self.getBestPolicy(state, legalActions)
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        pass
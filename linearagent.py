@@ -0,0 +1,147 @@
+import random as rd
+
+import numpy as np
+
+from environment import Action
+from distancefield import DistanceField
+from schedules import ConstantSchedule, ExponentialSchedule
+
+N_FEATURES = 20
+DISTANCE_TILES = (1, 3, 6)  # tiles [0], [1, 2], [3, 5], [6, ...] of the target distance
+
+
+class LinearAgent:
+    # Q(s, a) = w . phi(s, a) with hand-crafted features read from the environment by a one-step
+    # lookahead on the compiled move tables and a DistanceField: progress towards the nearest
+    # victim (or hospital when carrying), tile-coded target distance, inventory, pick/drop and
+    # proximity of the other agents. Memory is constant in the number of states and a step
+    # costs O(features) whatever the map size. The features of all legal actions are one
+    # [nLegal, N_FEATURES] matrix per step, and semi-gradient Q-learning updates are applied
+    # every batchSize transitions with a single matrix product. Same interface as RLAgent.
+    def __init__(self, environment, id=0, distanceField=None, batchSize: int=32):
+        self.id = id
+        self.environment = environment
+        self.distanceField = DistanceField(environment) if distanceField is None else distanceField
+        self.maxDistance = 2 * (environment.w + environment.h)
+        self.weights = np.zeros(N_FEATURES)
+
+        self.steps = 0
+        self.epsilonSchedule = ExponentialSchedule(1.0, 0.9999, minimum=0.05)
+        self.gammaSchedule = ConstantSchedule(0.95)
+        self.etaSchedule = ConstantSchedule(0.01)
+
+        # Features of the last state an action was chosen in, reused by updateQValues
+        self.lastState = None
+        self.lastActions = None
+        self.lastFeatures = None
+
+        self.batchSize = batchSize
+        self.batchFeatures = np.zeros((batchSize, N_FEATURES))
+        self.batchRewards = np.zeros(batchSize)
+        self.batchNextFeatures = np.zeros((batchSize, len(Action), N_FEATURES))
+        self.batchNextLegal = np.zeros((batchSize, len(Action)), dtype=bool)
+        self.batchFinals = np.zeros(batchSize, dtype=bool)
+        self.batchCount = 0
+
+    @property
+    def epsilon(self):
+        return self.epsilonSchedule.value(self.steps)
+
+    @property
+    def gamma(self):
+        return self.gammaSchedule.value(self.steps)
+
+    def getFeatures(self, legalActions):
+        environment = self.environment
+        field = self.distanceField
+        cell = environment.agentCells[self.id]
+        orientation = cell.agentFlag.orientation
+        carried = len(cell.agentFlag.inventory)
+        distance = field.getTargetDistance(cell, orientation, carried)
+        moves = {action: (nextOrientation, nextCell) for action, nextOrientation, nextCell in environment.moves[field.getNode(cell, orientation)]}
+        others = [otherCell for agentId, otherCell in environment.agentCells.items() if agentId != self.id]
+
+        features = np.zeros((len(legalActions), N_FEATURES))
+        for row, action in enumerate(legalActions):
+            phi = features[row]
+            phi[0] = 1
+            phi[1 + action] = 1
+            nextCell = cell
+            nextDistance = distance
+            if action in moves:
+                nextOrientation, nextCell = moves[action]
+                nextDistance = field.getTargetDistance(nextCell, nextOrientation, carried)
+                phi[7] = nextDistance < distance
+                phi[8] = nextDistance > distance
+                phi[9] = nextDistance < distance and carried > 0
+            elif action == Action.PICK:
+                phi[10] = 1
+            elif action == Action.DROP:
+                phi[11] = carried / 2
+
+            phi[12] = min(nextDistance, self.maxDistance) / self.maxDistance
+            phi[13 + sum(nextDistance >= tile for tile in DISTANCE_TILES)] = 1
+            if others:
+                nearest = min(abs(nextCell.x - other.x) + abs(nextCell.y - other.y) for other in others)
+                phi[17] = 1 / (1 + nearest)
+                phi[18] = nearest <= 1
+            phi[19] = carried / 2
+        return features
+
+    def getValues(self, legalActions):
+        features = self.getFeatures(legalActions)
+        return features, features @ self.weights
+
+    def getBestPolicy(self, state, legalActions=None):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        features, values = self.getValues(legalActions)
+        self.lastState, self.lastActions, self.lastFeatures = state, legalActions, features
+        return legalActions[int(values.argmax())]
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        if forceExplore or rd.random() < self.epsilonSchedule.value(self.steps):
+            self.lastState, self.lastActions, self.lastFeatures = state, legalActions, self.getFeatures(legalActions)
+            return rd.choice(legalActions)
+        return self.getBestPolicy(state, legalActions)
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        if old_state != self.lastState or actionDone not in self.lastActions:
+            return  # the action wasn't chosen by this agent, its features are unknown
+        self.steps += 1
+
+        i = self.batchCount
+        self.batchFeatures[i] = self.lastFeatures[self.lastActions.index(actionDone)]
+        self.batchRewards[i] = reward
+        self.batchFinals[i] = final
+        self.batchNextLegal[i] = False
+        if not final:
+            if legalActions is None:
+                legalActions = self.environment.getLegalActions(self.id)
+            self.batchNextFeatures[i, :len(legalActions)] = self.getFeatures(legalActions)
+            self.batchNextLegal[i, :len(legalActions)] = True
+        self.lastState = None
+
+        self.batchCount += 1
+        if self.batchCount == self.batchSize:
+            self.update()
+
+    def update(self):
+        n = self.batchCount
+        features = self.batchFeatures[:n]
+        values = features @ self.weights
+        nextValues = np.where(self.batchNextLegal[:n], self.batchNextFeatures[:n] @ self.weights, -np.inf).max(axis=1)
+        nextValues[self.batchFinals[:n]] = 0
+        errors = self.batchRewards[:n] + self.gammaSchedule.value(self.steps) * nextValues - values
+        self.weights += self.etaSchedule.value(self.steps) / n * (features.T @ errors)
+        self.batchCount = 0
+
+    def save(self, path, background=False):
+        with open(path, 'wb') as file:
+            np.save(file, self.weights)
+
+    def load(self, path, mmap=False):
+        with open(path, 'rb') as file:
+            self.weights = np.load(file)
@@ -1,378 +1,185 @@
-from __future__ import annotations
-from colorama import Fore, Back
-from enum import IntEnum
+import argparse
 import random as rd
-from typing import List
-import copy as cp
-import time
 
+from distancefield import DistanceField
+from dqnagent import DQNAgent
+from environment import Environment
+from evaluator import evaluate, printSummary, runEpisode
+from heuristicagent import HeuristicAgent
+from linearagent import LinearAgent
+from maps import loadMap
+from mctsagent import MCTSAgent
+from paralleltrainer import ParallelTrainer
+from planner import Planner
+from replaybuffer import ReplayBuffer
+from qtable import QTable
 from rlagent import RLAgent
+from telemetry import Telemetry
+from vectorenvironment import VectorEnvironment
 
-saved = 0
 
-
-class Action(IntEnum):
-    MOVE = 0
-    LEFT = 1
-    RIGHT = 2
-    PICK = 3
-    DROP = 4
-    NONE = 5
-
-
-class Orientation(IntEnum):
-    UP = 0
-    RIGHT = 1
-    DOWN = 2
-    LEFT = 3
-
-    def getOffset(self) -> tuple[int, int]:
-        if self == Orientation.UP:
-            return 0, -1
-        if self == Orientation.RIGHT:
-            return +1, 0
-        if self == Orientation.DOWN:
-            return 0, +1
-        if self == Orientation.LEFT:
-            return -1, 0
-
-    def getLeft(self) -> Orientation:
-        return Orientation((int(self) - 1)%4)
-
-    def getRight(self) -> Orientation:
-        return Orientation((int(self) + 1)%4)
-
-
-class AgentFlag:
-    def __init__(self, index: int=-1, orientation: Orientation=Orientation.UP, inventory: List[int]=[]):
-        self.index = index
-        self.orientation = orientation
-        self.inventory = inventory
-
-
-class HospitalFlag:
-    def __init__(self, index: int=-1):
-        self.index = index
-
-
-class StartFlag:
-    def __init__(self, index: int=-1, orientation: Orientation=Orientation.UP):
-        self.index = index
-        self.orientation = orientation
-
-
-class VictimFlag:
-    def __init__(self, index: int=-1):
-        self.index = index
-
-
-class Cell:
-    def __init__(self, x, y, agentIndex: int=-1, agentOrientation: Orientation=Orientation.UP, agentInventory: List[int]=[], hospitalIndex: int=-1, startIndex: int=-1, startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]={}):
-        self.x = x
-        self.y = y
-        self.agentFlag = AgentFlag(agentIndex, agentOrientation, agentInventory)
-        self.hospitalFlag = HospitalFlag(hospitalIndex)
-        self.startFlag = StartFlag(startIndex, startOrientation)
-        self.victimFlag = VictimFlag(victimIndex)
-        self.openOrientations = openOrientations
-
-    def __repr__(self):
-        result = '(' + str(self.x) + ', ' + str(self.y) + ', '
-
-        result += 'A' + str(self.agentFlag.index) + str(self.agentFlag.orientation) + ''.join(sorted([str(x) for x in self.agentFlag.inventory])) + ', '
-        result += 'H' + str(self.hospitalFlag.index) + ', '
-        result += 'V' + str(self.victimFlag.index) + ')'
-
-        return result
-
-    def __str__(self):
-        background = Back.BLACK
-        foreground = Fore.WHITE
-
-        if self.hospitalFlag.index != -1:
-            background = Back.BLUE
-
-        if self.victimFlag.index != -1:
-            background = Back.RED
-        
-        if len(self.agentFlag.inventory) == 1:
-            foreground = Fore.LIGHTRED_EX
-                
-        if len(self.agentFlag.inventory) == 2:
-            foreground = Fore.RED
-
-        if self.openOrientations == {Orientation.UP, Orientation.DOWN}:
-            result = '┃'
-        elif self.openOrientations == {Orientation.LEFT, Orientation.RIGHT}:
-            result = '━'
-
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.DOWN}:
-            result = '┏'
-        elif self.openOrientations == {Orientation.LEFT, Orientation.DOWN}:
-            result = '┓'
-        elif self.openOrientations == {Orientation.UP, Orientation.RIGHT}:
-            result = '┗'
-        elif self.openOrientations == {Orientation.UP, Orientation.LEFT}:
-            result = '┛'
-
-        elif self.openOrientations == {Orientation.UP, Orientation.DOWN, Orientation.RIGHT}:
-            result = '┣'
-        elif self.openOrientations == {Orientation.UP, Orientation.DOWN, Orientation.LEFT}:
-            result = '┫'
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.LEFT, Orientation.UP}:
-            result = '┻'
-        elif self.openOrientations == {Orientation.RIGHT, Orientation.LEFT, Orientation.DOWN}:
-            result = '┳'
-        
-        else:
-            result = '•'
-
-        if self.agentFlag.index != -1:
-            if self.agentFlag.orientation == Orientation.UP:
-                result = '▲'
-            elif self.agentFlag.orientation == Orientation.RIGHT:
-                result = '▶'
-            elif self.agentFlag.orientation == Orientation.DOWN:
-                result = '▼'
-            elif self.agentFlag.orientation == Orientation.LEFT:
-                result = '◀'
-        
-        return background + foreground + result + Back.BLACK + Fore.WHITE
-
-
-class Environment:
-    def __init__(self, w: int=5, h: int=5):
-        self.w = w
-        self.h = h
-        self.cellGrid = [[Cell(x, y) for y in range(h)] for x in range(w)]
-        self.saved = 0
-        self.step = 0
-
-    def runStep(self, agent, idiotDuVillage=False):
-        state = repr(self)
-        action = Action.NONE
-        if idiotDuVillage:
-            # action = rd.choice([x for x in self.getLegalActions(agent.id) if x in [Action.LEFT, Action.MOVE, Action.RIGHT]] + [Action.NONE])
-            action = rd.choice(self.getLegalActions(agent.id))
-        else:
-            action = agent.selectAction(state, self.getLegalActions(agent.id))
-        reward = self.doAction(agent.id, action)
-        
-        old_state = cp.deepcopy(state)
-        state = repr(self)
-        final = self.isFinal()
-        if not idiotDuVillage:
-            agent.updateQValues(old_state, action, state, reward, final)
-
-        if final or self.step == 150: self.reset()
-
-        self.step += 1
-
-    def getLegalActions(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-
-        legalActions = [Action.NONE]
-        if agentCell.agentFlag.orientation.getLeft() in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation.getLeft()).agentFlag.index == -1:
-            legalActions += [Action.LEFT]
-        if agentCell.agentFlag.orientation in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation).agentFlag.index == -1:
-            legalActions += [Action.MOVE]
-        if agentCell.agentFlag.orientation.getRight() in agentCell.openOrientations and \
-                self.simulateMove(agentCell, agentCell.agentFlag.orientation.getRight()).agentFlag.index == -1:
-            legalActions += [Action.RIGHT]
-        if agentCell.victimFlag.index != -1 and len(agentCell.agentFlag.inventory) < 2:
-            legalActions += [Action.PICK]
-        if agentCell.hospitalFlag.index != -1 and len(agentCell.agentFlag.inventory) > 0:
-            legalActions += [Action.DROP]
-
-        return legalActions
-
-    def setCell(self, x, y, agentIndex: int=-1, agentOrientation: Orientation=Orientation.UP,
-                agentInventory=[], hospitalIndex: int=-1, startIndex: int=-1,
-                startOrientation: Orientation=Orientation.UP, victimIndex: int=-1, openOrientations: set[Orientation]={}):
-        self.cellGrid[x][y].agentFlag.index = agentIndex
-        self.cellGrid[x][y].agentFlag.orientation = agentOrientation
-        self.cellGrid[x][y].agentFlag.inventory = [] if len(agentInventory) == 0 else agentInventory
-
-        self.cellGrid[x][y].hospitalFlag.index = hospitalIndex
-
-        self.cellGrid[x][y].startFlag.index = startIndex
-        self.cellGrid[x][y].startFlag.orientation = startOrientation
-
-        self.cellGrid[x][y].victimFlag.index = victimIndex
-
-        self.cellGrid[x][y].openOrientations = {} if len(openOrientations) == 0 else openOrientations
-
-    def doAction(self, agentId, action):
-        if action == Action.LEFT:
-            status, reward = self.doLeft(agentId)
-        if action == Action.MOVE:
-            status, reward = self.doMove(agentId)
-        if action == Action.RIGHT:
-            status, reward = self.doRight(agentId)
-        if action == Action.PICK:
-            status, reward = self.doPick(agentId)
-        if action == Action.DROP:
-            status, reward = self.doDrop(agentId)
-        if action == Action.NONE:
-            status, reward = self.doNone(agentId)
-
-        if not status:
-            reward -= 10
-        reward -= 1
-
-        return reward
-
-    def doLeft(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-
-        nextOrientation = agentCell.agentFlag.orientation.getLeft()
-        return self._moveOrientation(nextOrientation, agentCell), 0
-
-    def doMove(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-
-        nextOrientation = agentCell.agentFlag.orientation
-        return self._moveOrientation(nextOrientation, agentCell), 0
-    
-    def doRight(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-
-        nextOrientation = agentCell.agentFlag.orientation.getRight()
-        return self._moveOrientation(nextOrientation, agentCell), 0
-    
-    def doPick(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-
-        if agentCell.victimFlag.index == -1:
-            return False, 0
-        
-        agentCell.agentFlag.inventory += [agentCell.victimFlag.index]
-        agentCell.victimFlag.index = -1
-
-        return True, 50
-
-    def doDrop(self, agentId):
-        agentCell = self._getCellAgent(agentId)
-        nbVictim = len(agentCell.agentFlag.inventory)
-
-        self.saved += nbVictim
-
-        if nbVictim == 0:
-            return False, 0
-        
-        agentCell.agentFlag.inventory = []
-        return True, nbVictim*100
-    
-    def doNone(self, agentId):
-        return True, 0
-    
-    def isFinal(self):
-        for x in range(self.w):
-            for y in range(self.h):
-                if self.cellGrid[x][y].victimFlag.index != -1 or len(self.cellGrid[x][y].agentFlag.inventory) != 0:
-                    return False
-
-        return True
-
-    def reset(self):
-        self.step = 0
-        self.setCell(0, 0, openOrientations={Orientation.DOWN, Orientation.RIGHT}, victimIndex=1)
-        self.setCell(1, 0, openOrientations={Orientation.LEFT, Orientation.RIGHT})#, victimIndex=2)
-        self.setCell(2, 0, agentIndex=0, agentOrientation=Orientation.RIGHT, openOrientations={Orientation.LEFT, Orientation.DOWN, Orientation.RIGHT})
-        self.setCell(3, 0, openOrientations={Orientation.LEFT, Orientation.DOWN})#, victimIndex=3)
-        self.setCell(4, 0, openOrientations={})
-
-        self.setCell(0, 1, openOrientations={Orientation.DOWN, Orientation.UP})
-        self.setCell(1, 1, openOrientations={})
-        self.setCell(2, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT})#, victimIndex=4)
-        self.setCell(3, 1, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.LEFT}, hospitalIndex=1)
-        self.setCell(4, 1, openOrientations={})
-
-        self.setCell(0, 2, openOrientations={Orientation.UP, Orientation.DOWN, Orientation.RIGHT})
-        self.setCell(1, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT})
-        self.setCell(2, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(3, 2, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(4, 2, openOrientations={Orientation.LEFT, Orientation.DOWN})
-
-        self.setCell(0, 3, openOrientations={Orientation.UP, Orientation.DOWN})
-        self.setCell(1, 3, openOrientations={})
-        self.setCell(2, 3, openOrientations={Orientation.RIGHT, Orientation.DOWN})
-        self.setCell(3, 3, agentIndex=1, agentOrientation=Orientation.DOWN, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.DOWN})#, hospitalIndex=2)
-        self.setCell(4, 3, openOrientations={Orientation.LEFT, Orientation.UP})
-
-        self.setCell(0, 4, openOrientations={Orientation.UP, Orientation.RIGHT})
-        self.setCell(1, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT}, victimIndex=5)
-        self.setCell(2, 4, openOrientations={Orientation.LEFT, Orientation.RIGHT, Orientation.UP})
-        self.setCell(3, 4, openOrientations={Orientation.LEFT, Orientation.UP})
-        self.setCell(4, 4, openOrientations={})
-
-    def _getCellAgent(self, agentId):
-        # print("vvvvvvvvvvvvvvvvvvvvvv")
-        for x in range(self.w):
-            for y in range(self.h):
-                # print(self.cellGrid[x][y].agentFlag.index, "---", agentId)
-                if self.cellGrid[x][y].agentFlag.index == agentId:
-                    return self.cellGrid[x][y]
-    
-    def simulateMove(self, cell, orientation):
-        if orientation not in cell.openOrientations:
-            return None
-        deltaX, deltaY = orientation.getOffset()
-        return self.cellGrid[cell.x + deltaX][cell.y + deltaY]
-
-    def _moveOrientation(self, orientation, cell):
-        if orientation not in cell.openOrientations:
-            return False
-
-        deltaX, deltaY = orientation.getOffset()
-        newCell = self.cellGrid[cell.x + deltaX][cell.y + deltaY]
-
-        newCell.agentFlag.index = cell.agentFlag.index
-        newCell.agentFlag.orientation = orientation
-        newCell.agentFlag.inventory = cell.agentFlag.inventory
-
-        cell.agentFlag.index = -1
-        cell.agentFlag.orientation = Orientation.UP
-        cell.agentFlag.inventory = []
-
-        return True
-
-    def __repr__(self):
-        result = ""
-        for y in range(self.h):
-            for x in range(self.w):
-                result += repr(self.cellGrid[x][y]) + '\n'
-        return result
-
-    def __str__(self):
-        result = ""
-        for y in range(self.h):
-            for x in range(self.w):
-                result += str(self.cellGrid[x][y])
-            result += "\n"
-        return result
-    
-
-
-
-
-environment = Environment()
-environment.reset()
-agent = RLAgent(environment, 0)
-walker = RLAgent(environment, 1)
-
-agent = RLAgent(environment)
-for step in range(10_000_000):
-
-    if step <= 3_000_000:
-        if step % 10000 == 0:
+def train(environment, agent, walker, steps, logInterval=10000, renderInterval=0, checkpoint=None, checkpointEvery=0):
+    writer = None
+    for step in range(steps):
+        if logInterval and step % logInterval == 0:
             print(step)
+        if renderInterval and step % renderInterval == 0:
+            print("STEP:", step, "SAVED:", environment.saved, "VISITED:", str(len(getattr(agent, "q", ()))))
+            print(environment)
+        if checkpoint and checkpointEvery and step and step % checkpointEvery == 0:
+            if writer is not None:
+                writer.join()
+            writer = agent.save(checkpoint, background=True)
+
+        environment.runStep(agent)
+        environment.runStep(walker, True)
+
+    if writer is not None:
+        writer.join()
+    if checkpoint:
+        agent.save(checkpoint)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q-learning for DriveToGaether")
+    parser.add_argument("--steps", type=int, default=3_000_000, help="training steps (one learner and one walker action each)")
+    parser.add_argument("--log-interval", type=int, default=10000, help="print the step counter every N training steps, 0 to disable")
+    parser.add_argument("--metrics", default=None, help="stream training metrics to this file (.csv, otherwise JSON lines)")
+    parser.add_argument("--metrics-interval", type=int, default=10000, help="learner steps aggregated in each metrics row")
+    parser.add_argument("--render-interval", type=int, default=0, help="render the grid every N training steps, 0 to disable")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--map", default=None, help="map file (see maps.py) instead of the hard-coded 5x5 map")
+    parser.add_argument("--fail-penalty", type=float, default=0, help="penalty of an action that fails (10 in the first main.py)")
+    parser.add_argument("--uniform-walker", action="store_true", help="the walker plays uniformly at random instead of picking and dropping")
+    parser.add_argument("--shaping", type=float, default=0, help="scale of the distance-based reward shaping, 0 to disable")
+    parser.add_argument("--heuristic", action="store_true", help="also evaluate the greedy shortest-path HeuristicAgent")
+    parser.add_argument("--planner", action="store_true", help="also evaluate the optimal policy found offline by value iteration")
+    parser.add_argument("--mcts", action="store_true", help="also evaluate the online Monte-Carlo tree search agent")
+    parser.add_argument("--mcts-budget", type=float, default=10, help="milliseconds of search per MCTS decision")
+    parser.add_argument("--mcts-simulations", type=int, default=None, help="simulations per MCTS decision instead of a time budget")
+    parser.add_argument("--mcts-priors", action="store_true", help="start the MCTS action values from the trained Q-table")
+    parser.add_argument("--hashing", action="store_true", help="use incremental Zobrist hashes as state keys (not with --planner)")
+    parser.add_argument("--inventory-count", action="store_true", help="state keys only hold how many victims each agent carries")
+    parser.add_argument("--radius", type=int, default=None, help="state keys only hold what lies within this distance of the learner")
+    parser.add_argument("--no-other-orientations", action="store_true", help="state keys leave out the other agents' orientations")
+    parser.add_argument("--linear", action="store_true", help="learn a linear Q-function of distance features instead of a Q-table")
+    parser.add_argument("--dqn", action="store_true", help="learn a NumPy deep Q-network on grid observations instead of a Q-table")
+    parser.add_argument("--vector", type=int, default=0, help="train --dqn on N VectorEnvironment copies at once, 0 to use runStep")
+    parser.add_argument("--qtable", action="store_true", help="use the array-backed QTable instead of a dict")
+    parser.add_argument("--buffer-size", type=int, default=0, help="experience replay capacity, 0 to disable (implies --qtable)")
+    parser.add_argument("--buffer-batch", type=int, default=32, help="transitions replayed per batched update")
+    parser.add_argument("--buffer-every", type=int, default=4, help="updates between two replayed batches")
+    parser.add_argument("--prioritized", action="store_true", help="sample replayed transitions by TD error")
+    parser.add_argument("--workers", type=int, default=1, help="train in N processes with periodic Q-table merging")
+    parser.add_argument("--sync-interval", type=int, default=50000, help="steps per worker between two Q-table merges")
+    parser.add_argument("--checkpoint", default=None, help="write the Q-table snapshot to this file after training")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="also write it every N training steps, in the background")
+    parser.add_argument("--resume", default=None, help="start from a Q-table snapshot instead of an empty table")
+    parser.add_argument("--eval-episodes", type=int, default=100, help="greedy evaluation episodes after training")
+    parser.add_argument("--eval-workers", type=int, default=1, help="processes running the evaluation episodes")
+    parser.add_argument("--eval-seed", type=int, default=0, help="seed of the evaluation episodes")
+    parser.add_argument("--replay", type=int, default=0, help="rendered greedy episodes after evaluation")
+    parser.add_argument("--delay", type=float, default=0.3, help="seconds between rendered ticks during replay")
+    args = parser.parse_args()
+    if args.hashing and args.planner:
+        parser.error("--planner needs the exact state keys, it can't be used with --hashing")
+    abstraction = args.inventory_count or args.radius is not None or args.no_other_orientations
+    if abstraction and (args.hashing or args.planner or args.workers > 1):
+        parser.error("state abstractions can't be used with --hashing, --planner or --workers")
+    for flag in ("linear", "dqn"):
+        if getattr(args, flag) and (args.qtable or args.buffer_size or args.workers > 1 or args.planner):
+            parser.error("--" + flag + " has no Q-table, it can't be used with --qtable, --buffer-size, --workers or --planner")
+    if args.mcts_priors and (args.linear or args.dqn):
+        parser.error("--mcts-priors needs the Q-table of an RLAgent")
+    if (args.fail_penalty or args.uniform_walker) and (args.workers > 1 or args.vector or args.planner):
+        parser.error("--fail-penalty and --uniform-walker can't be used with --workers, --vector or --planner")
+    if (args.buffer_size or args.prioritized) and args.workers > 1:
+        parser.error("--buffer-size and --prioritized can't be used with --workers, the workers don't replay transitions")
+    if args.prioritized and not args.buffer_size:
+        parser.error("--prioritized needs --buffer-size")
+    if args.linear and args.dqn:
+        parser.error("--linear and --dqn are two different agents")
+    if args.vector and (not args.dqn or args.shaping or args.metrics):
+        parser.error("--vector needs --dqn and can't be used with --shaping or --metrics")
+    if args.metrics and args.workers > 1:
+        parser.error("--metrics can't be used with --workers, the steps of the worker processes aren't recorded")
+    if args.checkpoint_every and (args.workers > 1 or args.vector):
+        parser.error("--checkpoint-every can't be used with --workers or --vector, the checkpoint is only written after training")
+
+    if args.seed is not None:
+        rd.seed(args.seed)
+
+    environment = Environment(gameMap=loadMap(args.map) if args.map else None)
+    environment.reset()
+    environment.failPenalty = args.fail_penalty
+    environment.walkerPicks = not args.uniform_walker
+    if args.hashing:
+        environment.enableHashing(0 if args.seed is None else args.seed)
+    if abstraction:
+        environment.enableAbstraction(0, args.inventory_count, args.radius, not args.no_other_orientations)
+    if args.linear:
+        agent = LinearAgent(environment, 0)
+    elif args.dqn:
+        agent = DQNAgent(environment, 0, seed=args.seed)
     else:
-        time.sleep(0.3)
-        print("STEP:", step, "SAVED:", environment.saved, "VISITED:", str(len(agent.q)))
-        print(environment)
-
-    environment.runStep(agent)
-    environment.runStep(walker, True)
+        agent = RLAgent(environment, 0, QTable() if args.qtable or args.buffer_size else None, seed=args.seed)
+    if args.buffer_size:
+        agent.replay = ReplayBuffer(args.buffer_size, args.seed, args.prioritized)
+        agent.replayBatch = args.buffer_batch
+        agent.replayEvery = args.buffer_every
+    walker = RLAgent(environment, 1)
+    if args.resume:
+        agent.load(args.resume, mmap=True)
+    if args.shaping:
+        environment.shaping = DistanceField(environment, args.shaping, agent.gamma)
+        if args.linear:
+            agent.distanceField = environment.shaping
+
+    if args.workers > 1:
+        trainer = ParallelTrainer(args.workers, args.seed, args.sync_interval, agent.discountEpsilon, args.qtable, environment.gameMap,
+                                  (0 if args.seed is None else args.seed) if args.hashing else None, args.shaping,
+                                  agent.q if args.resume else None, (agent.epsilonSchedule, agent.gammaSchedule, agent.etaSchedule),
+                                  agent.steps)
+        trainer.train(args.steps)
+        trainer.close()
+        for (state, action), value in trainer.q.items():
+            agent.q[state, action] = value
+        agent.steps = trainer.steps
+        if args.checkpoint:
+            agent.save(args.checkpoint)
+    elif args.vector:
+        # --steps learner transitions, vector copies at a time
+        agent.trainVector(VectorEnvironment(environment, args.vector, seed=args.seed), args.steps // args.vector, walker.id)
+        environment.reset()
+        if args.checkpoint:
+            agent.save(args.checkpoint)
+    else:
+        if args.metrics:
+            environment.telemetry = Telemetry(args.metrics, agent, args.metrics_interval)
+        train(environment, agent, walker, args.steps, args.log_interval, args.render_interval, args.checkpoint, args.checkpoint_every)
+        if environment.telemetry is not None:
+            environment.telemetry.close()
+            environment.telemetry = None
+    environment.shaping = None
+    if args.eval_episodes:
+        printSummary(evaluate(agent, args.eval_episodes, args.eval_workers, args.eval_seed, walker.id))
+        if args.heuristic:
+            printSummary(evaluate(HeuristicAgent(environment, agent.id), args.eval_episodes, args.eval_workers, args.eval_seed, walker.id))
+        if args.planner:
+            environment.reset()
+            planner = Planner(environment, agent.id, (walker.id,), agent.gamma)
+            planner.solve()
+            printSummary(evaluate(RLAgent(environment, agent.id, planner.toQTable()), args.eval_episodes, args.eval_workers, args.eval_seed, walker.id))
+            agreement, known = planner.agreement(agent)
+            print("OPTIMAL ACTIONS: %.3f" % agreement, "OF", known, "VISITED STATES")
+        if args.mcts:
+            environment.reset()
+            mcts = MCTSAgent(environment, agent.id, walker.id, args.mcts_budget / 1000, args.mcts_simulations,
+                             q=agent.q if args.mcts_priors else None)
+            printSummary(evaluate(mcts, args.eval_episodes, args.eval_workers, args.eval_seed, walker.id))
+    for _ in range(args.replay):
+        runEpisode(environment, agent, walker.id, args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import json
+import random as rd
+
+from environment import Environment, Orientation, toMask, toOrientations
+
+# Glyphs of the text format, one per set of open orientations (U, R, D, L bits)
+GLYPHS = {
+    0b0000: '•', 0b0001: '╵', 0b0010: '╶', 0b0100: '╷', 0b1000: '╴',
+    0b0101: '┃', 0b1010: '━', 0b0110: '┏', 0b1100: '┓', 0b0011: '┗', 0b1001: '┛',
+    0b0111: '┣', 0b1101: '┫', 0b1011: '┻', 0b1110: '┳', 0b1111: '╋',
+}
+MASKS = {glyph: mask for mask, glyph in GLYPHS.items()}
+LETTERS = 'URDL'
+
+
+class Map:
+    # Static description of a DriveToGaether map: roads as open orientations per cell, plus
+    # victims, hospitals and agent starts as {(x, y): index} (starts also hold an orientation)
+    def __init__(self, w: int, h: int):
+        self.w = w
+        self.h = h
+        self.openOrientations = [[set() for y in range(h)] for x in range(w)]
+        self.victims = {}
+        self.hospitals = {}
+        self.starts = {}
+
+    def apply(self, environment):
+        # Agents are put on their start cells, like reset() does for the hard-coded map. Roads,
+        # hospitals and starts never change, so once the map is applied only the cells of the
+        # agents, the start cells and the victims' cells are set again, unless walls were
+        # changed by setCell since.
+        if environment.gameMap is self and environment.appliedWalls == environment.wallChanges:
+            cells = {(cell.x, cell.y) for cell in environment.agentCells.values()}
+            cells.update(self.starts)
+            cells.update(self.victims)
+        else:
+            cells = [(x, y) for x in range(self.w) for y in range(self.h)]
+        for x, y in cells:
+            startIndex, startOrientation = self.starts.get((x, y), (-1, Orientation.UP))
+            environment.setCell(x, y, agentIndex=startIndex, agentOrientation=startOrientation,
+                                hospitalIndex=self.hospitals.get((x, y), -1), startIndex=startIndex,
+                                startOrientation=startOrientation, victimIndex=self.victims.get((x, y), -1),
+                                openOrientations=self.openOrientations[x][y])
+        environment.appliedWalls = environment.wallChanges
+
+    @classmethod
+    def fromEnvironment(cls, environment):
+        gameMap = cls(environment.w, environment.h)
+        for column in environment.cellGrid:
+            for cell in column:
+                gameMap.openOrientations[cell.x][cell.y] = set(cell.openOrientations)
+                if cell.victimFlag.index != -1:
+                    gameMap.victims[cell.x, cell.y] = cell.victimFlag.index
+                if cell.hospitalFlag.index != -1:
+                    gameMap.hospitals[cell.x, cell.y] = cell.hospitalFlag.index
+                if cell.startFlag.index != -1:
+                    gameMap.starts[cell.x, cell.y] = (cell.startFlag.index, cell.startFlag.orientation)
+                elif cell.agentFlag.index != -1:
+                    gameMap.starts[cell.x, cell.y] = (cell.agentFlag.index, cell.agentFlag.orientation)
+        return gameMap
+
+    def toJson(self):
+        return {
+            "w": self.w,
+            "h": self.h,
+            "roads": [' '.join(''.join(LETTERS[o] for o in sorted(self.openOrientations[x][y])) or '.' for x in range(self.w)) for y in range(self.h)],
+            "victims": [[x, y, index] for (x, y), index in sorted(self.victims.items())],
+            "hospitals": [[x, y, index] for (x, y), index in sorted(self.hospitals.items())],
+            "starts": [[x, y, index, orientation.name] for (x, y), (index, orientation) in sorted(self.starts.items())],
+        }
+
+    @classmethod
+    def fromJson(cls, data):
+        gameMap = cls(data["w"], data["h"])
+        for y, row in enumerate(data["roads"]):
+            for x, letters in enumerate(row.split()):
+                gameMap.openOrientations[x][y] = {Orientation(LETTERS.index(letter)) for letter in letters if letter != '.'}
+        gameMap.victims = {(x, y): index for x, y, index in data.get("victims", [])}
+        gameMap.hospitals = {(x, y): index for x, y, index in data.get("hospitals", [])}
+        gameMap.starts = {(x, y): (index, Orientation[orientation]) for x, y, index, orientation in data.get("starts", [])}
+        return gameMap
+
+    def toText(self):
+        lines = [''.join(GLYPHS[toMask(self.openOrientations[x][y])] for x in range(self.w)) for y in range(self.h)]
+        lines += ["victim %d %d %d" % (x, y, index) for (x, y), index in sorted(self.victims.items())]
+        lines += ["hospital %d %d %d" % (x, y, index) for (x, y), index in sorted(self.hospitals.items())]
+        lines += ["start %d %d %d %s" % (x, y, index, orientation.name) for (x, y), (index, orientation) in sorted(self.starts.items())]
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def fromText(cls, text):
+        # Grid lines made of GLYPHS first, then one "victim|hospital|start x y index [ORIENTATION]" per line
+        lines = [line.rstrip('\n') for line in text.splitlines() if line.strip()]
+        rows = [line for line in lines if line[0] in MASKS]
+        gameMap = cls(len(rows[0]), len(rows))
+        for y, row in enumerate(rows):
+            for x, glyph in enumerate(row):
+                gameMap.openOrientations[x][y] = toOrientations(MASKS[glyph])
+
+        for line in lines[len(rows):]:
+            kind, x, y, index, *orientation = line.split()
+            position = (int(x), int(y))
+            if kind == "victim":
+                gameMap.victims[position] = int(index)
+            elif kind == "hospital":
+                gameMap.hospitals[position] = int(index)
+            elif kind == "start":
+                gameMap.starts[position] = (int(index), Orientation[orientation[0]])
+            else:
+                raise ValueError("unknown map entry: " + line)
+        return gameMap
+
+
+def loadMap(path):
+    with open(path, encoding="utf-8") as file:
+        if path.endswith(".json"):
+            return Map.fromJson(json.load(file))
+        return Map.fromText(file.read())
+
+
+def saveMap(gameMap, path):
+    with open(path, "w", encoding="utf-8") as file:
+        if path.endswith(".json"):
+            json.dump(gameMap.toJson(), file, indent=1)
+        else:
+            file.write(gameMap.toText())
+
+
+def _roadLines(size, spacing, random):
+    lines = [0]
+    while lines[-1] + spacing[1] < size - 1:
+        lines.append(lines[-1] + random.randint(*spacing))
+    if lines[-1] != size - 1:
+        lines.append(size - 1)
+    return lines
+
+
+def generateMap(w: int, h: int, victims: int=5, hospitals: int=2, starts: int=2, seed=None, spacing=(2, 4)):
+    # Two-way road grid with random block sizes: every road cell has at least two exits, so
+    # agents (which can't U-turn) never end up in a dead end
+    random = rd.Random(seed)
+    rows = _roadLines(h, spacing, random)
+    columns = _roadLines(w, spacing, random)
+
+    gameMap = Map(w, h)
+    for y in rows:
+        for x in range(w - 1):
+            gameMap.openOrientations[x][y].add(Orientation.RIGHT)
+            gameMap.openOrientations[x + 1][y].add(Orientation.LEFT)
+    for x in columns:
+        for y in range(h - 1):
+            gameMap.openOrientations[x][y].add(Orientation.DOWN)
+            gameMap.openOrientations[x][y + 1].add(Orientation.UP)
+
+    roads = [(x, y) for x in range(w) for y in range(h) if gameMap.openOrientations[x][y]]
+    if victims + hospitals + starts > len(roads):
+        raise ValueError("map too small for %d victims, %d hospitals and %d starts" % (victims, hospitals, starts))
+    cells = random.sample(roads, victims + hospitals + starts)
+    gameMap.victims = {cell: index + 1 for index, cell in enumerate(cells[:victims])}
+    gameMap.hospitals = {cell: index + 1 for index, cell in enumerate(cells[victims:victims + hospitals])}
+    for index, (x, y) in enumerate(cells[victims + hospitals:]):
+        gameMap.starts[x, y] = (index, random.choice(sorted(gameMap.openOrientations[x][y])))
+    return gameMap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or convert DriveToGaether maps")
+    parser.add_argument("output", help="map file to write (.json, anything else is the text format)")
+    parser.add_argument("--input", default=None, help="map file to convert instead of generating one")
+    parser.add_argument("--default", action="store_true", help="export the hard-coded 5x5 map of Environment.reset")
+    parser.add_argument("--size", type=int, nargs=2, default=[10, 10], metavar=("W", "H"))
+    parser.add_argument("--victims", type=int, default=5)
+    parser.add_argument("--hospitals", type=int, default=2)
+    parser.add_argument("--starts", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.input:
+        gameMap = loadMap(args.input)
+    elif args.default:
+        environment = Environment()
+        environment.reset()
+        gameMap = Map.fromEnvironment(environment)
+    else:
+        gameMap = generateMap(args.size[0], args.size[1], args.victims, args.hospitals, args.starts, args.seed)
+    saveMap(gameMap, args.output)
+
+
+if __name__ == "__main__":
+    main()
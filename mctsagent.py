@@ -0,0 +1,196 @@
+import math
+import random as rd
+import time
+
+from environment import MAX_STEPS
+from heuristicagent import HeuristicAgent
+
+
+class Node:
+    # Decision node of the learner. The grid is deterministic given the learner's action and the
+    # walker's reply, so the first time an edge is played its reward, whether it ended the
+    # episode, the walker's possible replies and the nodes they lead to are recorded on the node
+    __slots__ = ("snapshot", "actions", "visits", "counts", "values", "rewards", "finals", "walkerActions", "children")
+
+    def __init__(self, snapshot, actions, counts, values):
+        self.snapshot = snapshot  # Environment.snapshot() of the node's grid
+        self.actions = actions
+        self.visits = sum(counts)
+        self.counts = counts
+        self.values = values  # sums of the returns
+        self.rewards = [None] * len(actions)
+        self.finals = [False] * len(actions)
+        self.walkerActions = [None] * len(actions)
+        self.children = {}  # (action index, walker action) -> Node, or FINAL
+
+
+FINAL = Node(None, (), [], [])  # reached when the walker's reply ends the episode
+
+
+class MCTSAgent:
+    # Online UCT search with the Environment itself as the model and the random walker as a
+    # chance node (one sampled outcome of getWalkerActions per visit). Nodes are shared by exact
+    # state key across simulations and decisions. A simulation descends the recorded edges
+    # without touching the grid, which is only restored and stepped at the first unknown edge;
+    # the new leaf is evaluated by a short rollout of the greedy HeuristicAgent. The search
+    # stops after `simulations` simulations, or after `budget` seconds when simulations is None.
+    # With q (an RLAgent table) the actions of new nodes start with priorVisits virtual visits
+    # at their Q-value. Every episode starts from an empty tree and a random generator seeded
+    # from the global one, so seeded episodes (see evaluator.py) don't depend on each other.
+    def __init__(self, environment, id=0, walkerId: int=1, budget: float=0.01, simulations=None, depth: int=20,
+                 rolloutDepth: int=10, exploration: float=50, gamma: float=0.98, q=None, priorVisits: int=5,
+                 maxNodes: int=200000):
+        self.id = id
+        self.walkerId = walkerId
+        self.environment = environment
+        self.budget = budget
+        self.simulations = simulations
+        self.depth = depth
+        self.rolloutDepth = rolloutDepth
+        self.exploration = exploration
+        self.gamma = gamma
+        self.q = q
+        self.priorVisits = priorVisits
+        self.maxNodes = maxNodes
+        self.random = None
+        self.heuristic = HeuristicAgent(environment, id)
+        self.epsilon = 0
+
+        self.tree = {}
+        self.root = None
+        self.horizon = depth
+        self.lastStep = None
+        self.lastSimulations = 0
+
+    def expand(self, snapshot, legalActions):
+        counts = [0] * len(legalActions)
+        values = [0.0] * len(legalActions)
+        if self.q is not None:
+            state = self.environment.getState()
+            for i, action in enumerate(legalActions):
+                value = self.q.get((state, action))
+                if value is not None:
+                    counts[i] = self.priorVisits
+                    values[i] = self.priorVisits * value
+        node = self.tree[snapshot[0]] = Node(snapshot, legalActions, counts, values)
+        return node
+
+    def selectChild(self, node):
+        logVisits = math.log(node.visits + 1)
+        best = 0
+        bestScore = -math.inf
+        for i, count in enumerate(node.counts):
+            if count == 0:
+                return i
+            score = node.values[i] / count + self.exploration * math.sqrt(logVisits / count)
+            if score > bestScore:
+                best = i
+                bestScore = score
+        return best
+
+    def walkerStep(self):
+        # Chance node: plays one of the walker's equally likely actions
+        actions = self.environment.getWalkerActions(self.walkerId)
+        self.environment.doAction(self.walkerId, actions[int(self.random.random() * len(actions))])
+
+    def rollout(self, depth):
+        environment = self.environment
+        total = 0
+        discount = 1
+        for _ in range(depth):
+            total += discount * environment.doAction(self.id, self.heuristic.getBestPolicy(None))
+            if environment.isFinal():
+                break
+            self.walkerStep()
+            if environment.isFinal():
+                break
+            discount *= self.gamma
+        return total
+
+    def step(self, node, i):
+        # Replays the learner's action i from the node's grid and records its outcome
+        environment = self.environment
+        environment.restore(node.snapshot)
+        node.rewards[i] = environment.doAction(self.id, node.actions[i])
+        node.finals[i] = environment.isFinal()
+        if not node.finals[i]:
+            node.walkerActions[i] = environment.getWalkerActions(self.walkerId)
+
+    def simulate(self):
+        environment = self.environment
+        horizon = self.horizon
+        node = self.root
+        path = []
+        leafValue = 0
+        for depth in range(horizon):
+            i = self.selectChild(node)
+            stepped = node.rewards[i] is None
+            if stepped:
+                self.step(node, i)
+            path.append((node, i))
+            if node.finals[i]:
+                break
+
+            walkerActions = node.walkerActions[i]
+            walkerAction = walkerActions[int(self.random.random() * len(walkerActions))]
+            child = node.children.get((i, walkerAction))
+            if child is None:
+                if not stepped:
+                    environment.restore(node.snapshot)
+                    environment.doAction(self.id, node.actions[i])
+                environment.doAction(self.walkerId, walkerAction)
+                if environment.isFinal():
+                    node.children[i, walkerAction] = FINAL
+                    break
+                snapshot = environment.snapshot()
+                child = self.tree.get(snapshot[0])
+                if child is None:
+                    node.children[i, walkerAction] = self.expand(snapshot, environment.getLegalActions(self.id))
+                    leafValue = self.rollout(min(self.rolloutDepth, horizon - depth - 1))
+                    break
+                node.children[i, walkerAction] = child
+            elif child is FINAL:
+                break
+            node = child
+
+        value = leafValue
+        for node, i in reversed(path):
+            value = node.rewards[i] + self.gamma * value
+            node.visits += 1
+            node.counts[i] += 1
+            node.values[i] += value
+
+    def search(self, state, legalActions=None):
+        environment = self.environment
+        if self.lastStep is None or environment.step <= self.lastStep:
+            # New episode
+            self.random = rd.Random(rd.getrandbits(64))
+            self.tree = {}
+        self.lastStep = environment.step
+        if len(self.tree) > self.maxNodes:
+            self.tree = {}
+        snapshot = environment.snapshot()
+        root = self.tree.get(snapshot[0])
+        if root is None:
+            root = self.expand(snapshot, environment.getLegalActions(self.id) if legalActions is None else legalActions)
+        self.root = root
+        self.horizon = max(1, min(self.depth, (MAX_STEPS - environment.step + 1) // 2))
+
+        simulations = 0
+        deadline = time.perf_counter() + self.budget
+        while simulations < self.simulations if self.simulations is not None else time.perf_counter() < deadline:
+            self.simulate()
+            simulations += 1
+        environment.restore(snapshot)
+
+        self.lastSimulations = simulations
+        return root.actions[max(range(len(root.actions)), key=lambda i: root.counts[i])]
+
+    def getBestPolicy(self, state, legalActions=None):
+        return self.search(state, legalActions)
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        return self.search(state, legalActions)
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        pass
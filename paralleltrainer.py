@@ -0,0 +1,117 @@
+import multiprocessing as mp
+import random as rd
+
+from distancefield import DistanceField
+from environment import Environment
+from qtable import QTable
+from rlagent import RLAgent
+from schedules import ExponentialSchedule, ScaledSchedule
+
+
+def _worker(connection, seed, schedules, steps, useTable, gameMap, hashing, shaping):
+    rd.seed(seed)
+    environment = Environment(gameMap=gameMap)
+    environment.reset()
+    if hashing is not None:
+        environment.enableHashing(hashing)
+    agent = RLAgent(environment, 0, QTable() if useTable else None)
+    agent.epsilonSchedule, agent.gammaSchedule, agent.etaSchedule = schedules
+    agent.steps = steps
+    agent.visits = {}
+    walker = RLAgent(environment, 1)
+    if shaping:
+        environment.shaping = DistanceField(environment, shaping, agent.gamma)
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        steps, updates = message
+        for state, action, value in updates:
+            agent.q[state, action] = value
+
+        saved = environment.saved
+        startSteps = agent.steps
+        for _ in range(steps):
+            environment.runStep(agent)
+            environment.runStep(walker, True)
+
+        entries = [(state, int(action), agent.q[state, action], count) for (state, action), count in agent.visits.items()]
+        agent.visits = {}
+        connection.send((entries, environment.saved - saved, agent.epsilon, agent.steps - startSteps))
+
+    connection.close()
+
+
+class ParallelTrainer:
+    # Runs one Environment/RLAgent pair per process. Every syncInterval steps the workers send
+    # the entries they updated, the master merges them by visit-weighted averaging and
+    # broadcasts the merged entries back, so all workers restart each round from the same table.
+    # With a hashing seed the workers key their tables with the same Zobrist hashes as
+    # Environment.enableHashing(hashing) in the master, and with a shaping scale they learn
+    # from the shaped rewards of a DistanceField like main.py --shaping. A starting table q
+    # (e.g. a resumed snapshot) is sent to the workers with their first round. The workers
+    # continue the (epsilon, gamma, eta) schedules of an RLAgent from its step counter steps,
+    # by default an epsilon decaying by discountEpsilon from 1.0; self.steps counts on from
+    # steps with every learner step of the workers.
+    def __init__(self, workers: int=mp.cpu_count(), seed=None, syncInterval: int=50000, discountEpsilon: float=0.999999, useTable: bool=False,
+                 gameMap=None, hashing=None, shaping: float=0, q=None, schedules=None, steps: int=0):
+        self.workers = workers
+        self.syncInterval = syncInterval
+        self.q = {}
+        self.updates = [] if q is None else [(state, action, value) for (state, action), value in q.items()]
+        self.saved = 0
+        self.steps = steps
+        self.epsilons = []
+        if schedules is None:
+            agent = RLAgent(None)
+            schedules = (ExponentialSchedule(1.0, discountEpsilon), agent.gammaSchedule, agent.etaSchedule)
+
+        seed = rd.randrange(1 << 30) if seed is None else seed
+        self.connections = []
+        self.processes = []
+        for k in range(workers):
+            # Each worker does 1/workers of the steps, so its schedules run about workers times
+            # faster; the spread around that rate gives every worker its own exploration schedule
+            epsilonSchedule, gammaSchedule, etaSchedule = schedules
+            workerSchedules = (ScaledSchedule(epsilonSchedule, workers * (0.5 + k / max(workers - 1, 1)), steps),
+                               ScaledSchedule(gammaSchedule, workers, steps), ScaledSchedule(etaSchedule, workers, steps))
+            parentConnection, childConnection = mp.Pipe()
+            process = mp.Process(target=_worker, args=(childConnection, seed + k, workerSchedules, steps, useTable, gameMap, hashing, shaping), daemon=True)
+            process.start()
+            self.connections.append(parentConnection)
+            self.processes.append(process)
+
+    def train(self, steps):
+        # steps is the total number of learner steps, shared between the workers
+        remaining = steps
+        while remaining > 0:
+            roundSteps = min(self.syncInterval, -(-remaining // self.workers))
+            remaining -= roundSteps * self.workers
+            for connection in self.connections:
+                connection.send((roundSteps, self.updates))
+
+            merged = {}
+            self.epsilons = []
+            for connection in self.connections:
+                entries, saved, epsilon, steps = connection.recv()
+                self.saved += saved
+                self.steps += steps
+                self.epsilons.append(epsilon)
+                for state, action, value, count in entries:
+                    total, weight = merged.get((state, action), (0, 0))
+                    merged[state, action] = (total + value * count, weight + count)
+
+            self.updates = []
+            for (state, action), (total, weight) in merged.items():
+                self.q[state, action] = total / weight
+                self.updates.append((state, action, total / weight))
+
+        return self.q
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,214 @@
+import argparse
+import time
+from array import array
+
+import numpy as np
+
+from environment import Environment, MAX_STEPS
+from maps import loadMap
+from qtable import QTable
+from rlagent import RLAgent
+from vectorenvironment import VectorEnvironment
+
+N_ACTIONS = 6
+
+
+def _unique(keys):
+    # Sorted distinct keys; sorting is much faster than the hashing np.unique does on int64
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+
+
+class Planner:
+    # Offline value iteration on the exact model of a map. The learner acts deterministically,
+    # then every walker plays its random policy (chance nodes), so over all learner states
+    # reachable from reset():
+    #   Q(s, a) = r(s, a) + gamma * sum_w p(w) * V(s'_w),  V(s) = max_a Q(s, a)
+    # with V = 0 once the grid is final. Transitions are generated in batches with
+    # VectorEnvironment, whose keys are those of StateEncoder, so the result is an RLAgent
+    # Q-table. The MAX_STEPS episode cap is not modelled, like in Q-learning.
+    def __init__(self, environment, agentId: int=0, walkerIds=(1,), gamma: float=0.9997, batchSize: int=65536):
+        self.agentId = agentId
+        self.walkerIds = walkerIds
+        self.gamma = gamma
+        self.batchSize = batchSize
+        self.vector = VectorEnvironment(environment, 1)
+        self.start = environment.getState()
+
+        self.states = None
+        self.V = None
+        self.Q = None
+
+    def _expandLearner(self, keys):
+        # Learner pairs of a batch of states: (state, action, reward, state after the action),
+        # the latter -1 when the action ends the episode
+        vector = self.vector
+        vector.setStates(keys)
+        legal = vector.getLegalActions(self.agentId)
+
+        pairs = []
+        for action in range(N_ACTIONS):
+            rows = np.flatnonzero(legal[:, action])
+            if len(rows) == 0:
+                continue
+            vector.setStates(keys[rows])
+            rewards = vector.doAction(self.agentId, np.full(len(rows), action))
+            afterKeys = np.where(vector.isFinal(), -1, vector.getStates())
+            pairs.append((keys[rows], np.full(len(rows), action, dtype=np.int8), rewards, afterKeys))
+        return pairs
+
+    def _expandWalkers(self, keys):
+        # Chance edges (state after the learner, next learner state, probability) of the walkers
+        # playing in turn; next state -1 is the terminal state
+        vector = self.vector
+        parents = keys
+        probabilities = np.ones(len(keys))
+        edges = []
+        for walkerId in self.walkerIds:
+            if len(keys) == 0:
+                break
+            vector.setStates(keys)
+            walkerProbabilities = vector.walkerProbabilities(walkerId)
+            chance = []
+            for walkerAction in range(N_ACTIONS):
+                rows = np.flatnonzero(walkerProbabilities[:, walkerAction] > 0)
+                if len(rows) == 0:
+                    continue
+                vector.setStates(keys[rows])
+                vector.doAction(walkerId, np.full(len(rows), walkerAction))
+                outcomes = np.where(vector.isFinal(), -1, vector.getStates())
+                chance.append((parents[rows], outcomes, probabilities[rows] * walkerProbabilities[rows, walkerAction]))
+
+            parents, keys, probabilities = (np.concatenate(column) for column in zip(*chance))
+            terminal = keys == -1
+            edges.append((parents[terminal], keys[terminal], probabilities[terminal]))
+            parents, keys, probabilities = parents[~terminal], keys[~terminal], probabilities[~terminal]
+        edges.append((parents, keys, probabilities))
+        return edges
+
+    def explore(self):
+        # Breadth-first enumeration of the learner states reachable from the start state. The
+        # walker outcomes only depend on the state after the learner acted, which many pairs
+        # share (e.g. MOVE and LEFT into the same cell), so they are expanded once per such state.
+        states = np.array([self.start], dtype=np.int64)
+        afterStates = np.array([], dtype=np.int64)
+        frontier = states
+        pairs = []
+        edges = []
+        while len(frontier):
+            newPairs = []
+            for first in range(0, len(frontier), self.batchSize):
+                newPairs += self._expandLearner(frontier[first:first + self.batchSize])
+            pairs += newPairs
+
+            reached = _unique(np.concatenate([afterKeys for _, _, _, afterKeys in newPairs]))
+            newAfterStates = np.setdiff1d(reached[reached != -1], afterStates, assume_unique=True)
+            afterStates = _unique(np.concatenate((afterStates, newAfterStates)))
+            newEdges = []
+            for first in range(0, len(newAfterStates), self.batchSize):
+                newEdges += self._expandWalkers(newAfterStates[first:first + self.batchSize])
+            edges += newEdges
+
+            reached = _unique(np.concatenate([nextKeys for _, nextKeys, _ in newEdges] + [np.array([], dtype=np.int64)]))
+            frontier = np.setdiff1d(reached[reached != -1], states, assume_unique=True)
+            states = _unique(np.concatenate((states, frontier)))
+
+        self.states = states
+        self.afterStates = afterStates
+        pairStates, pairActions, pairRewards, pairAfter = (np.concatenate(column) for column in zip(*pairs))
+        edgeAfter, edgeNext, self.edgeProbabilities = (np.concatenate(column) for column in zip(*edges))
+
+        # Pairs sorted by state so that V is a maximum.reduceat over contiguous runs; the last
+        # entry of V and of the after-state values is the terminal state
+        pairStates = np.searchsorted(states, pairStates)
+        order = np.argsort(pairStates, kind='stable')
+        self.pairStates = pairStates[order]
+        self.pairActions = pairActions[order]
+        self.pairRewards = pairRewards[order].astype(np.float64)
+        self.pairAfter = np.where(pairAfter == -1, len(afterStates), np.searchsorted(afterStates, pairAfter))[order]
+        self.edgeAfter = np.searchsorted(afterStates, edgeAfter)
+        self.edgeNext = np.where(edgeNext == -1, len(states), np.searchsorted(states, edgeNext))
+        self.stateStarts = np.flatnonzero(np.r_[True, self.pairStates[1:] != self.pairStates[:-1]])
+        return len(states)
+
+    def solve(self, maxIterations: int=MAX_STEPS, tolerance: float=1e-3):
+        # Synchronous value iteration from V = 0 until the largest change of V is below
+        # tolerance. With gamma close to 1 the states where the episode can never end (e.g. the
+        # walker stuck with victims) converge very slowly, so sweeps are capped: after k sweeps
+        # the values are exact for the next k learner decisions, and an episode has MAX_TICKS.
+        if self.states is None:
+            self.explore()
+
+        V = np.zeros(len(self.states) + 1)
+        afterValues = np.zeros(len(self.afterStates) + 1)
+        for iteration in range(maxIterations):
+            afterValues[:-1] = np.bincount(self.edgeAfter, self.edgeProbabilities * V[self.edgeNext], minlength=len(self.afterStates))
+            Q = self.pairRewards + self.gamma * afterValues[self.pairAfter]
+            values = np.maximum.reduceat(Q, self.stateStarts)
+            delta = np.abs(values - V[:-1]).max()
+            V[:-1] = values
+            if delta < tolerance:
+                break
+
+        self.V = V
+        self.Q = Q
+        return iteration + 1, delta
+
+    def toQTable(self):
+        values = np.full(len(self.states) * N_ACTIONS, np.nan, dtype=np.float32)
+        values[self.pairStates * N_ACTIONS + self.pairActions] = self.Q
+        table = array('f')
+        table.frombytes(values.tobytes())
+        return QTable.fromBuffers(self.states.tolist(), table, len(self.Q), N_ACTIONS)
+
+    def getValue(self, state):
+        index = np.searchsorted(self.states, state)
+        if index < len(self.states) and self.states[index] == state:
+            return float(self.V[index])
+        return None
+
+    def agreement(self, agent):
+        # Share of the agent's visited states where its greedy action is also optimal in the
+        # plan, and the number of those states the plan knows
+        table = self.toQTable()
+        agreeing = 0
+        known = 0
+        for state in {state for state, _ in agent.q.keys()}:
+            value = self.getValue(state)
+            if value is None:
+                continue
+            known += 1
+            legalActions = [a for a in range(N_ACTIONS) if (state, a) in table]
+            agreeing += table[state, agent.getBestPolicy(state, legalActions)] >= value - 1e-2
+        return agreeing / max(known, 1), known
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a DriveToGaether map offline by value iteration")
+    parser.add_argument("output", help="RLAgent snapshot to write (load it with main.py --resume)")
+    parser.add_argument("--map", default=None, help="map file (see maps.py) instead of the hard-coded 5x5 map")
+    parser.add_argument("--gamma", type=float, default=0.9997)
+    parser.add_argument("--iterations", type=int, default=MAX_STEPS, help="maximum number of value iteration sweeps")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    environment = Environment(gameMap=loadMap(args.map) if args.map else None)
+    environment.reset()
+    planner = Planner(environment, gamma=args.gamma)
+
+    start = time.perf_counter()
+    nStates = planner.explore()
+    explored = time.perf_counter()
+    iterations, delta = planner.solve(args.iterations, args.tolerance)
+    solved = time.perf_counter()
+    print("STATES:", nStates, "PAIRS:", len(planner.Q), "EDGES:", len(planner.edgeNext), "EXPLORE: %.1fs" % (explored - start))
+    print("ITERATIONS:", iterations, "DELTA: %.2g" % delta, "SOLVE: %.1fs" % (solved - explored), "START VALUE: %.2f" % planner.getValue(planner.start))
+
+    agent = RLAgent(environment, 0, planner.toQTable())
+    agent.epsilon = 0
+    agent.gamma = args.gamma
+    agent.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
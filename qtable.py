@@ -0,0 +1,270 @@
+from array import array
+
+import numpy as np
+
+NAN = float('nan')
+EMPTY = -1
+FIBONACCI = 0x9E3779B97F4A7C15  # 2^64 / golden ratio, spreads structured keys over the slots
+MASK64 = (1 << 64) - 1
+
+
+class QTable:
+    # Dense Q-table: states are interned to consecutive ids and the values live in one flat
+    # float32 matrix of shape [nStates, nActions]. NaN marks a (state, action) pair that was
+    # never visited, so the dict semantics used by RLAgent (missing key != 0) are kept.
+    # The ids are found in a preallocated open-addressing table of NumPy arrays (uint64 keys
+    # and int32 ids, linear probing, at most 3/4 full), so a state costs 12 to 32 bytes of
+    # index instead of a Python int and a dict slot. Keys wider than 64 bits (exact keys of
+    # very large maps) go to a dict. Scalar reads go through memoryviews of the arrays, which
+    # return Python ints and floats without building NumPy scalars.
+    def __init__(self, nActions: int=6, capacity: int=1024, typecode: str='f'):
+        self.nActions = nActions
+        self.typecode = typecode
+        self.capacity = capacity  # states the value matrix holds before growing
+        self.nStates = 0
+        self.size = 0
+        self.setValues(np.full(capacity * nActions, np.nan, dtype=typecode))
+        self.setSlots(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int32), capacity)
+        self.wideIds = {}  # state -> id for keys that don't fit in 64 bits
+        self.lastState = None  # last state found, the current state is looked up repeatedly
+        self.lastId = None
+
+    def setValues(self, values):
+        self.valueArray = values
+        self.values = memoryview(values)
+
+    def setSlots(self, keys, ids, nStates):
+        # Rebuilds the open-addressing table with room for nStates states
+        slots = 16
+        while 3 * slots < 4 * nStates:
+            slots *= 2
+        self.slotMask = slots - 1
+        self.shift = 64 - slots.bit_length() + 1
+        self.keyArray = np.zeros(slots, dtype=np.uint64)
+        self.idArray = np.full(slots, EMPTY, dtype=np.int32)
+
+        # Vectorized linear probing: every round, each key still unplaced takes its slot if
+        # it's empty and no earlier key wants it, and the others move on to the next slot
+        slotArray = ((keys * np.uint64(FIBONACCI)) >> np.uint64(self.shift)).astype(np.int64)
+        pending = np.arange(len(keys))
+        while len(pending):
+            free = self.idArray[slotArray[pending]] == EMPTY
+            candidates = pending[free]
+            _, first = np.unique(slotArray[candidates], return_index=True)
+            placed = candidates[first]
+            self.keyArray[slotArray[placed]] = keys[placed]
+            self.idArray[slotArray[placed]] = ids[placed]
+            isPlaced = np.zeros(len(keys), dtype=bool)
+            isPlaced[placed] = True
+            pending = pending[~isPlaced[pending]]
+            slotArray[pending] = (slotArray[pending] + 1) & self.slotMask
+
+        self.keyView = memoryview(self.keyArray)
+        self.idView = memoryview(self.idArray)
+
+    def getStateId(self, state, create=True):
+        if state == self.lastState:
+            return self.lastId
+        if state >> 64 or state < 0:
+            stateId = self.wideIds.get(state)
+            if stateId is None and create:
+                stateId = self.wideIds[state] = self.newId()
+        else:
+            keys = self.keyView
+            ids = self.idView
+            slot = (state * FIBONACCI & MASK64) >> self.shift
+            while True:
+                stateId = ids[slot]
+                if stateId == EMPTY or keys[slot] == state:
+                    break
+                slot = (slot + 1) & self.slotMask
+            if stateId == EMPTY:
+                if not create:
+                    return None
+                stateId = self.newId()
+                if 4 * self.nStates > 3 * (self.slotMask + 1):
+                    self.rehash(state, stateId)
+                else:
+                    keys[slot] = state
+                    ids[slot] = stateId
+        if stateId is not None:
+            self.lastState = state
+            self.lastId = stateId
+        return stateId
+
+    def newId(self):
+        stateId = self.nStates
+        if stateId == self.capacity:
+            self._grow()
+        self.nStates += 1
+        return stateId
+
+    def rehash(self, state=None, stateId=None):
+        used = self.idArray != EMPTY
+        keys = self.keyArray[used]
+        ids = self.idArray[used]
+        if state is not None:
+            keys = np.append(keys, np.uint64(state))
+            ids = np.append(ids, np.int32(stateId))
+        self.setSlots(keys, ids, 2 * self.nStates)
+
+    @property
+    def states(self):
+        # State keys ordered by id
+        used = self.idArray != EMPTY
+        ordered = np.zeros(self.nStates, dtype=np.uint64)
+        ordered[self.idArray[used]] = self.keyArray[used]
+        states = ordered.tolist()
+        for state, stateId in self.wideIds.items():
+            states[stateId] = state
+        return states
+
+    @classmethod
+    def fromItems(cls, items, nActions: int=6):
+        table = cls(nActions)
+        for (state, action), value in items:
+            table[state, action] = value
+        return table
+
+    @classmethod
+    def fromBuffers(cls, states, values, size, nActions: int=6):
+        # Wraps existing storage, e.g. a memoryview over a memory-mapped snapshot
+        table = cls.__new__(cls)
+        table.nActions = nActions
+        table.typecode = values.format if isinstance(values, memoryview) else values.typecode
+        table.capacity = len(states)
+        table.nStates = len(states)
+        table.size = size
+        table.valueArray = None
+        table.values = values if isinstance(values, memoryview) else memoryview(values)
+        table.wideIds = {}
+        table.lastState = None
+        table.lastId = None
+        try:
+            keys = np.array(states, dtype=np.uint64)
+            ids = np.arange(len(states), dtype=np.int32)
+        except OverflowError:
+            narrow = [(state, stateId) for stateId, state in enumerate(states) if not (state >> 64 or state < 0)]
+            table.wideIds = {state: stateId for stateId, state in enumerate(states) if state >> 64 or state < 0}
+            keys = np.array([state for state, _ in narrow], dtype=np.uint64)
+            ids = np.array([stateId for _, stateId in narrow], dtype=np.int32)
+        table.setSlots(keys, ids, len(states))
+        return table
+
+    def __getstate__(self):
+        # Memoryviews can't be pickled: the arrays are sent instead, and buffers wrapped by
+        # fromBuffers (e.g. a memory-mapped snapshot) as a copy, so tables can be sent to
+        # worker processes
+        state = self.__dict__.copy()
+        for name in ('values', 'keyView', 'idView'):
+            del state[name]
+        if self.valueArray is None:
+            state['valueArray'] = np.frombuffer(self.values, dtype=self.typecode).copy()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.values = memoryview(self.valueArray)
+        self.keyView = memoryview(self.keyArray)
+        self.idView = memoryview(self.idArray)
+
+    def _grow(self):
+        # Buffers wrapped by fromBuffers can't be resized, they are copied on the first growth
+        values = np.frombuffer(self.values, dtype=self.typecode)
+        added = np.full(max(self.capacity, 1) * self.nActions, np.nan, dtype=self.typecode)
+        self.setValues(np.concatenate((values[:self.capacity * self.nActions], added)))
+        self.capacity = 2 * max(self.capacity, 1)
+
+    def getBestAction(self, state, actions):
+        bestAction = actions[0]
+        stateId = self.getStateId(state, False)
+        if stateId is None:
+            return bestAction
+
+        values = self.values
+        base = stateId * self.nActions
+        bestValue = values[base + bestAction]
+        for a in actions:
+            value = values[base + a]
+            if value == value and (bestValue != bestValue or value > bestValue):
+                bestAction = a
+                bestValue = value
+
+        return bestAction
+
+    def getBestValue(self, state, actions):
+        stateId = self.getStateId(state, False)
+        if stateId is None:
+            return 0
+
+        value = self.values[stateId * self.nActions + self.getBestAction(state, actions)]
+        return 0 if value != value else value
+
+    def getIndex(self, state, action):
+        # Flat index of (state, action), creating the entry with a value of 0 if unvisited
+        index = self.getStateId(state) * self.nActions + action
+        values = self.values
+        if values[index] != values[index]:
+            self.size += 1
+            values[index] = 0
+        return index
+
+    def get(self, key, default=None):
+        state, action = key
+        stateId = self.getStateId(state, False)
+        if stateId is None:
+            return default
+        value = self.values[stateId * self.nActions + action]
+        return default if value != value else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        # getIndex first: growing the table replaces self.values
+        index = self.getIndex(*key)
+        self.values[index] = value
+
+    def __len__(self):
+        return self.size
+
+    def keys(self):
+        values = self.values
+        for stateId, state in enumerate(self.states):
+            base = stateId * self.nActions
+            for a in range(self.nActions):
+                if values[base + a] == values[base + a]:
+                    yield state, a
+
+    def items(self):
+        values = self.values
+        for stateId, state in enumerate(self.states):
+            base = stateId * self.nActions
+            for a in range(self.nActions):
+                if values[base + a] == values[base + a]:
+                    yield (state, a), values[base + a]
+
+    def __iter__(self):
+        return self.keys()
+
+
+def packStates(states):
+    # Fixed-width little-endian unsigned ints, 8 bytes unless a key needs more
+    width = max(8, -(-max((state.bit_length() for state in states), default=0) // 8))
+    if width == 8:
+        return width, array('Q', states).tobytes()
+    return width, b''.join(state.to_bytes(width, 'little') for state in states)
+
+
+def unpackStates(buffer, width, n):
+    if width == 8:
+        states = array('Q')
+        states.frombytes(buffer[:8 * n])
+        return states.tolist()
+    return [int.from_bytes(buffer[i * width:(i + 1) * width], 'little') for i in range(n)]
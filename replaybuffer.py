@@ -0,0 +1,158 @@
+import numpy as np
+
+from qtable import QTable
+
+
+class SumTree:
+    # Sum tree of priorities with `branching` children per node. Every level keeps, for each
+    # of its nodes, the running sums of its children as one row [0, c0, c0 + c1, ...], so a
+    # descent step is one row gather and a comparison. Setting leaves and drawing a batch cost
+    # O(batch * branching * depth) = O(batch log capacity) and are vectorized over the batch;
+    # the wide tree keeps the depth, and so the number of NumPy calls, at 4 for a million
+    # transitions.
+    def __init__(self, capacity: int, branching: int=32):
+        self.branching = branching
+        self.sums = []  # per level from the root, (nodes, branching + 1) running sums
+        self.totals = []  # per level, the sum under each of its nodes
+        nodes = 1
+        while True:
+            self.sums.append(np.zeros((nodes, branching + 1)))
+            self.totals.append(np.zeros(nodes))
+            nodes *= branching
+            if nodes >= capacity:
+                break
+        self.leaves = np.zeros(nodes)
+        self.pending = []  # leaves set since the sums were last propagated
+
+    def total(self):
+        self.propagate()
+        return self.totals[0][0]
+
+    def get(self, indices):
+        return self.leaves[indices]
+
+    # Leaves are only written by setOne and set; the sums above them are brought up to date
+    # in one pass by the next total(), so a batch of updates plus the transitions added since
+    # the previous batch cost a single propagation
+
+    def setOne(self, index, value):
+        self.leaves[index] = value
+        self.pending.append(index)
+
+    def set(self, indices, values):
+        self.leaves[indices] = values
+        self.pending += indices.tolist()
+
+    def propagate(self):
+        if not self.pending:
+            return
+        indices = np.array(self.pending, dtype=np.int64)
+        self.pending = []
+        children = self.leaves
+        for depth in range(len(self.sums) - 1, -1, -1):
+            indices = indices // self.branching
+            running = np.cumsum(children.reshape(-1, self.branching)[indices], axis=1)
+            self.sums[depth][indices, 1:] = running
+            self.totals[depth][indices] = running[:, -1]
+            children = self.totals[depth]
+
+    def find(self, values):
+        # Leaves whose prefix sums contain values, descending one level per step
+        rows = np.arange(len(values))
+        nodes = np.zeros(len(values), dtype=np.int64)
+        for sums in self.sums:
+            block = sums[nodes]
+            child = (block[:, 1:-1] <= values[:, None]).sum(axis=1)
+            values = values - block[rows, child]
+            nodes = nodes * self.branching + child
+        return nodes
+
+
+class ReplayBuffer:
+    # Fixed-capacity ring of transitions stored as QTable state ids in preallocated arrays.
+    # The legal actions of the next state are kept as a bitmask so the batched update can
+    # take the same max over legal, visited actions as RLAgent.getBestPolicyReward.
+    # Prioritized sampling draws transitions in proportion to |TD error| ** alpha from a
+    # SumTree and corrects the bias with importance-sampling weights (N * P(i)) ** -beta
+    # scaling the learning rate, normalized by the largest weight of the batch.
+    def __init__(self, capacity: int=100000, seed=None, prioritized: bool=False, alpha: float=0.6, beta: float=0.4):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.rng = np.random.default_rng(seed)
+
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.nextStates = np.zeros(capacity, dtype=np.int64)
+        self.nextLegal = np.zeros(capacity, dtype=np.uint8)
+        self.finals = np.zeros(capacity, dtype=bool)
+        self.priorities = SumTree(capacity) if prioritized else None  # |TD error| ** alpha
+        self.maxPriority = 1.0
+
+        self.size = 0
+        self.position = 0
+
+    def add(self, table, old_state, action, reward, state, legalActions, final):
+        if not isinstance(table, QTable):
+            raise TypeError("experience replay needs a QTable backend")
+
+        legalMask = 0
+        for a in legalActions or ():
+            legalMask |= 1 << a
+
+        i = self.position
+        self.states[i] = table.getStateId(old_state)
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.nextStates[i] = table.getStateId(state)
+        self.nextLegal[i] = legalMask
+        self.finals[i] = final
+        if self.prioritized:
+            self.priorities.setOne(i, self.maxPriority)  # new transitions are likely replayed soon
+
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batchSize):
+        # Indices of a batch and their importance-sampling weights (None when uniform)
+        if not self.prioritized:
+            return self.rng.integers(0, self.size, batchSize), None
+
+        total = self.priorities.total()
+        indices = np.minimum(self.priorities.find(self.rng.random(batchSize) * total), self.size - 1)
+        weights = (self.size * self.priorities.get(indices) / total) ** -self.beta
+        return indices, weights / weights.max()
+
+    def update(self, table, batchSize, eta, gamma):
+        # One vectorized Q-learning step on a sampled batch, same rule as RLAgent.updateQValues;
+        # duplicated (state, action) pairs in a batch keep the last write
+        if self.size == 0:
+            return
+
+        indices, weights = self.sample(batchSize)
+        values = np.frombuffer(table.values, dtype=np.float32 if table.typecode == 'f' else np.float64).reshape(-1, table.nActions)
+        states = self.states[indices]
+        actions = self.actions[indices]
+        rewards = self.rewards[indices]
+        finals = self.finals[indices]
+
+        nextValues = values[self.nextStates[indices]]
+        legal = (self.nextLegal[indices, None] >> np.arange(table.nActions, dtype=np.uint8)) & 1 == 1
+        nextValues = np.where(legal & ~np.isnan(nextValues), nextValues, -np.inf).max(axis=1)
+        nextValues[np.isinf(nextValues)] = 0
+
+        current = values[states, actions]
+        visited = ~np.isnan(current)
+        current = np.where(visited, current, 0)
+        target = rewards + gamma * nextValues
+        if weights is not None:
+            eta = eta * weights
+        values[states, actions] = np.where(finals, rewards, (1 - eta) * current + eta * target)
+        table.size += len(np.unique(states[~visited] * table.nActions + actions[~visited]))
+
+        if self.prioritized:
+            priorities = (np.abs(np.where(finals, rewards, target) - current) + 1e-3) ** self.alpha
+            self.priorities.set(indices, priorities)
+            self.maxPriority = max(self.maxPriority, float(priorities.max()))
@@ -1,55 +1,240 @@
 import random as rd
 import copy as cp
+import json
+import mmap as mm
+import os
+import struct
+import threading
+from array import array
+
+from qtable import QTable, packStates, unpackStates
+import schedules
+from schedules import ConstantSchedule, ExponentialSchedule, RandomBlock
+
+# Snapshot layout: header, nStates fixed-width state keys (padded to 8 bytes), then the
+# float32 values of shape [nStates, nActions] with NaN for unvisited pairs. Version 2 appends
+# the agent's step counter to the version 1 header, version 3 then the epsilon, gamma and eta
+# schedules as length-prefixed JSON (padded to 8 bytes): the header only holds their current
+# values and the decay of an ExponentialSchedule.
+SNAPSHOT_MAGIC = b'DTGQ'
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct('<4sHHddddQQI4x')
+SNAPSHOT_STEPS = struct.Struct('<Q')
+SNAPSHOT_SCHEDULES = struct.Struct('<I')
+
+
+def _scheduleToJson(schedule):
+    return dict(vars(schedule), type=type(schedule).__name__)
+
+
+def _scheduleFromJson(data):
+    data = dict(data)
+    cls = getattr(schedules, data.pop('type'))
+    schedule = cls.__new__(cls)
+    vars(schedule).update(data)
+    return schedule
+
+
+def _writeSnapshot(path, q, header):
+    # q is a dict copy of the table or (states, values as bytes, typecode, size, nActions)
+    # copied from a QTable; header holds epsilon, discountEpsilon, gamma, eta, steps and the
+    # serialized schedules
+    if isinstance(q, dict):
+        table = QTable.fromItems(q.items())
+        q = (table.states, table.values[:table.nStates * table.nActions].tobytes(), table.typecode, len(table), table.nActions)
+    states, values, typecode, size, nActions = q
+    if typecode != 'f':
+        values = array('f', array(typecode, values)).tobytes()
+    epsilon, discountEpsilon, gamma, eta, steps, schedulesJson = header
+    width, states = packStates(states)
+    chunks = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, nActions, epsilon, discountEpsilon,
+                                   gamma, eta, len(q[0]), size, width) + SNAPSHOT_STEPS.pack(steps),
+              schedulesJson, bytes(-len(schedulesJson) % 8), states, bytes(-len(states) % 8), values]
+
+    with open(path + '.tmp', 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+    os.replace(path + '.tmp', path)
+
 
 class RLAgent:
-    def __init__(self, environment, id=0):
+    def __init__(self, environment, id=0, q=None, seed=None):
         self.id = id
-        self.q = {}
-        self.epsilon = 1.0  # exploration
-        self.discountEpsilon = 0.999999
-        self.gamma = 0.9997  # discount factor
-        self.eta = .2  # learning rate
+        self.q = {} if q is None else q  # dict keyed by (state, action) or a QTable
+
+        # Hyperparameters are schedules evaluated on the number of updates done so far,
+        # see schedules.py; epsilon, discountEpsilon, gamma and eta below are views on them
+        self.steps = 0
+        self.epsilonSchedule = ExponentialSchedule(1.0, 0.999999)  # exploration
+        self.gammaSchedule = ConstantSchedule(0.9997)  # discount factor
+        self.etaSchedule = ConstantSchedule(.2)  # learning rate
+        # With a seed, exploration draws come from seeded blocks indexed by steps, so resuming
+        # from a snapshot replays the same exploration as an uninterrupted run
+        self.randoms = None if seed is None else RandomBlock(seed)
 
         self.environment = environment
 
         self.lastReward = 0
         self.lastAction = ""
 
-    def getRandomPolicy(self):
-        return rd.choice(self.environment.getLegalActions(self.id))
-    
-    def getBestPolicy(self, state):
-        actions = self.environment.getLegalActions(self.id)
+        self.visits = None  # optional (state, action) -> update count, used to merge Q-tables
+
+        # Optional ReplayBuffer (QTable backend only): every transition is stored and every
+        # replayEvery updates a batch of replayBatch stored transitions is replayed
+        self.replay = None
+        self.replayEvery = 4
+        self.replayBatch = 32
+
+    @property
+    def epsilon(self):
+        return self.epsilonSchedule.value(self.steps)
+
+    @epsilon.setter
+    def epsilon(self, value):
+        self.epsilonSchedule = ExponentialSchedule(value, self.discountEpsilon, self.steps)
+
+    @property
+    def discountEpsilon(self):
+        return getattr(self.epsilonSchedule, 'decay', 1.0)
+
+    @discountEpsilon.setter
+    def discountEpsilon(self, value):
+        self.epsilonSchedule = ExponentialSchedule(self.epsilon, value, self.steps)
+
+    @property
+    def gamma(self):
+        return self.gammaSchedule.value(self.steps)
+
+    @gamma.setter
+    def gamma(self, value):
+        self.gammaSchedule = ConstantSchedule(value)
+
+    @property
+    def eta(self):
+        return self.etaSchedule.value(self.steps)
+
+    @eta.setter
+    def eta(self, value):
+        self.etaSchedule = ConstantSchedule(value)
+
+    # legalActions are the actions legal in the given state; when omitted they are asked to
+    # the environment, which is only right if state is its current state
+
+    def getRandomPolicy(self, legalActions=None):
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        return rd.choice(legalActions)
+
+    def getBestPolicy(self, state, legalActions=None):
+        actions = self.environment.getLegalActions(self.id) if legalActions is None else legalActions
+        if isinstance(self.q, QTable):
+            return self.q.getBestAction(state, actions)
 
         bestAction = actions[0]
+        bestValue = self.q.get((state, bestAction))
         for a in actions:
-            if (state, a) in self.q.keys():
-                if (state, bestAction) in self.q.keys():
-                    if self.q[state, a] > self.q[state, bestAction]:
-                        bestAction = a
-                else:
-                    bestAction = a
+            value = self.q.get((state, a))
+            if value is not None and (bestValue is None or value > bestValue):
+                bestAction = a
+                bestValue = value
 
         return bestAction
-    
-    def getBestPolicyReward(self, state):
-        key = (state, self.getBestPolicy(state))
-        if key in self.q.keys():
-            return self.q[state, self.getBestPolicy(state)]
-        return 0
-    
-    def updateQValues(self, old_state, actionDone, state, reward, final=False):
-        if (old_state, actionDone) not in self.q.keys():
+
+    def getBestPolicyReward(self, state, legalActions=None):
+        if isinstance(self.q, QTable):
+            return self.q.getBestValue(state, self.environment.getLegalActions(self.id) if legalActions is None else legalActions)
+
+        return self.q.get((state, self.getBestPolicy(state, legalActions)), 0)
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        if self.visits is not None:
+            self.visits[old_state, actionDone] = self.visits.get((old_state, actionDone), 0) + 1
+
+        eta = self.etaSchedule.value(self.steps)
+        self.steps += 1
+        if isinstance(self.q, QTable):
+            index = self.q.getIndex(old_state, actionDone)
+            if final:
+                self.q.values[index] = reward
+            else:
+                if legalActions is None:
+                    legalActions = self.environment.getLegalActions(self.id)
+                self.q.values[index] = (1 - eta) * self.q.values[index] + eta * (reward + \
+                        self.getBestPolicyReward(state, legalActions) * self.gammaSchedule.value(self.steps - 1))
+
+            if self.replay is not None:
+                self.replay.add(self.q, old_state, actionDone, reward, state, None if final else legalActions, final)
+                if self.steps % self.replayEvery == 0:
+                    self.replay.update(self.q, self.replayBatch, eta, self.gammaSchedule.value(self.steps - 1))
+            return
+
+        if (old_state, actionDone) not in self.q:
             self.q[old_state, actionDone] = 0
         if final:
             self.q[old_state, actionDone] = reward
         else:
-            self.q[old_state, actionDone] = (1 - self.eta) * self.q[old_state, actionDone] + self.eta * (reward + \
-                    self.getBestPolicyReward(state) * self.gamma)
-            self.epsilon = self.epsilon * self.discountEpsilon
+            self.q[old_state, actionDone] = (1 - eta) * self.q[old_state, actionDone] + eta * (reward + \
+                    self.getBestPolicyReward(state, legalActions) * self.gammaSchedule.value(self.steps - 1))
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        if self.randoms is None:
+            if rd.random() < self.epsilonSchedule.value(self.steps):
+                return self.getRandomPolicy(legalActions)
+            return self.getBestPolicy(state, legalActions)
 
-    def selectAction(self, state, forceExplore=False, debug=False):
-        if rd.random() < self.epsilon:
-            return self.getRandomPolicy()
+        if legalActions is None:
+            legalActions = self.environment.getLegalActions(self.id)
+        if self.randoms.get(2 * self.steps) < self.epsilonSchedule.value(self.steps):
+            return legalActions[int(self.randoms.get(2 * self.steps + 1) * len(legalActions))]
+        return self.getBestPolicy(state, legalActions)
+
+    def save(self, path, background=False):
+        # Only flat copies of the table are made before returning (a dict copy, or the state
+        # keys and values buffer of a QTable), so with background=True the snapshot is built,
+        # packed and written in a thread while training goes on mutating the table
+        if isinstance(self.q, QTable):
+            q = (self.q.states, self.q.values[:self.q.nStates * self.q.nActions].tobytes(), self.q.typecode, len(self.q), self.q.nActions)
         else:
-            return self.getBestPolicy(state)
+            q = dict(self.q)
+        schedulesJson = json.dumps({name: _scheduleToJson(getattr(self, name + 'Schedule')) for name in ('epsilon', 'gamma', 'eta')}).encode()
+        header = (self.epsilon, self.discountEpsilon, self.gamma, self.eta, self.steps,
+                  SNAPSHOT_SCHEDULES.pack(len(schedulesJson)) + schedulesJson)
+        if background:
+            thread = threading.Thread(target=_writeSnapshot, args=(path, q, header))
+            thread.start()
+            return thread
+        _writeSnapshot(path, q, header)
+
+    def load(self, path, mmap=False):
+        # With mmap=True the values are mapped copy-on-write: they aren't read up front and
+        # updates stay private to this process until the table has to grow. The state keys are
+        # still read and indexed in a dict either way, about 0.2 s per 500k states.
+        with open(path, 'rb') as file:
+            buffer = mm.mmap(file.fileno(), 0, access=mm.ACCESS_COPY) if mmap else file.read()
+
+        magic, version, nActions, epsilon, discountEpsilon, self.gamma, self.eta, nStates, size, width = \
+                SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC or not 1 <= version <= SNAPSHOT_VERSION:
+            raise ValueError(path + " is not a Q-table snapshot")
+
+        offset = SNAPSHOT_HEADER.size
+        self.steps = 0
+        if version >= 2:
+            self.steps, = SNAPSHOT_STEPS.unpack_from(buffer, offset)
+            offset += SNAPSHOT_STEPS.size
+        self.epsilonSchedule = ExponentialSchedule(epsilon, discountEpsilon, self.steps)
+        if version >= 3:
+            length, = SNAPSHOT_SCHEDULES.unpack_from(buffer, offset)
+            offset += SNAPSHOT_SCHEDULES.size
+            for name, schedule in json.loads(bytes(buffer[offset:offset + length])).items():
+                setattr(self, name + 'Schedule', _scheduleFromJson(schedule))
+            offset += length + (-(SNAPSHOT_SCHEDULES.size + length) % 8)
+        states = unpackStates(memoryview(buffer)[offset:], width, nStates)
+        offset += nStates * width + (-nStates * width) % 8
+        if mmap:
+            values = memoryview(buffer)[offset:offset + 4 * nStates * nActions].cast('f')
+        else:
+            values = array('f')
+            values.frombytes(buffer[offset:offset + 4 * nStates * nActions])
+
+        self.q = QTable.fromBuffers(states, values, size, nActions)
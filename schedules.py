@@ -0,0 +1,83 @@
+import random as rd
+
+
+class ConstantSchedule:
+    def __init__(self, value: float):
+        self.start = value
+
+    def value(self, step):
+        return self.start
+
+
+class LinearSchedule:
+    # From start to end over `steps` steps beginning at startStep, then stays at end
+    def __init__(self, start: float, end: float, steps: int, startStep: int=0):
+        self.start = start
+        self.end = end
+        self.steps = steps
+        self.startStep = startStep
+
+    def value(self, step):
+        progress = (step - self.startStep) / self.steps
+        if progress >= 1:
+            return self.end
+        return self.start + (self.end - self.start) * max(progress, 0)
+
+
+class ExponentialSchedule:
+    # start * decay ** (step - startStep), never below minimum: the closed form of
+    # multiplying by decay on every step
+    def __init__(self, start: float, decay: float, startStep: int=0, minimum: float=0):
+        self.start = start
+        self.decay = decay
+        self.startStep = startStep
+        self.minimum = minimum
+
+    def value(self, step):
+        return max(self.start * self.decay ** (step - self.startStep), self.minimum)
+
+
+class PiecewiseSchedule:
+    # Linear interpolation between sorted (step, value) points, constant outside of them
+    def __init__(self, points):
+        self.points = sorted(points)
+        self.start = self.points[0][1]
+
+    def value(self, step):
+        points = self.points
+        if step <= points[0][0]:
+            return points[0][1]
+        for (step0, value0), (step1, value1) in zip(points, points[1:]):
+            if step < step1:
+                return value0 + (value1 - value0) * (step - step0) / (step1 - step0)
+        return points[-1][1]
+
+
+class ScaledSchedule:
+    # schedule with the steps after origin counted scale times, e.g. for a worker doing
+    # 1/scale of the steps of a shared run
+    def __init__(self, schedule, scale: float, origin: int=0):
+        self.schedule = schedule
+        self.scale = scale
+        self.origin = origin
+
+    def value(self, step):
+        return self.schedule.value(self.origin + (step - self.origin) * self.scale)
+
+
+class RandomBlock:
+    # Uniform numbers drawn in blocks, where block k only depends on (seed, k): the number
+    # used at a given index is the same whether training ran in one go or was resumed
+    def __init__(self, seed: int, size: int=4096):
+        self.seed = seed
+        self.size = size
+        self.blockIndex = None
+        self.block = None
+
+    def get(self, index):
+        blockIndex, offset = divmod(index, self.size)
+        if blockIndex != self.blockIndex:
+            random = rd.Random(self.seed * 1000003 + blockIndex).random
+            self.block = [random() for _ in range(self.size)]
+            self.blockIndex = blockIndex
+        return self.block[offset]
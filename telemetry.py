@@ -0,0 +1,100 @@
+import csv
+import json
+import time
+
+FIELDS = ["step", "episodes", "return", "length", "saved", "qSize", "epsilon", "stepsPerSecond",
+          "envTime", "selectTime", "updateTime"]
+
+
+class Telemetry:
+    # Training metrics aggregated in-process and written as one row every `interval` learner
+    # steps, to a .csv file or to JSON lines for anything else. Environment.runStep feeds it:
+    # record() costs a few additions per step, and the per-phase times (µs per learner step)
+    # are only measured on one step out of timingEvery to keep the overhead small.
+    def __init__(self, path, agent, interval: int=10000, timingEvery: int=16):
+        self.agent = agent
+        self.interval = interval
+        self.timingEvery = timingEvery
+        self.file = open(path, "w", newline="")
+        self.writer = None
+        if path.endswith(".csv"):
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            self.writer.writeheader()
+
+        self.step = 0
+        self.flushedStep = 0
+        self.episodeReturn = 0
+        self.episodeLength = 0
+        self.savedBefore = 0
+        self.lastTime = time.perf_counter()
+        self.clear()
+
+    def clear(self):
+        self.episodes = 0
+        self.returns = 0
+        self.lengths = 0
+        self.saved = 0
+        self.timedSteps = 0
+        self.envTime = 0
+        self.selectTime = 0
+        self.updateTime = 0
+
+    def timeNext(self):
+        return self.step % self.timingEvery == 0
+
+    def addTimes(self, envTime, selectTime, updateTime):
+        self.timedSteps += 1
+        self.envTime += envTime
+        self.selectTime += selectTime
+        self.updateTime += updateTime
+
+    def record(self, reward):
+        self.episodeReturn += reward
+        self.episodeLength += 1
+        self.step += 1
+        if self.step % self.interval == 0:
+            self.flush()
+
+    def endEpisode(self, saved):
+        # saved is the environment's running total; the length is the number of learner steps
+        # recorded since the previous episode ended
+        self.episodes += 1
+        self.returns += self.episodeReturn
+        self.lengths += self.episodeLength
+        self.saved += saved - self.savedBefore
+        self.episodeReturn = 0
+        self.episodeLength = 0
+        self.savedBefore = saved
+
+    def flush(self):
+        now = time.perf_counter()
+        episodes = max(self.episodes, 1)
+        timedSteps = max(self.timedSteps, 1)
+        row = {
+            "step": self.step,
+            "episodes": self.episodes,
+            "return": self.returns / episodes,
+            "length": self.lengths / episodes,
+            "saved": self.saved / episodes,
+            "qSize": len(getattr(self.agent, "q", ())),
+            "epsilon": self.agent.epsilon,
+            "stepsPerSecond": (self.step - self.flushedStep) / (now - self.lastTime),
+            "envTime": self.envTime / timedSteps * 1e6,
+            "selectTime": self.selectTime / timedSteps * 1e6,
+            "updateTime": self.updateTime / timedSteps * 1e6,
+        }
+        if self.writer is not None:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+        self.clear()
+        self.flushedStep = self.step
+        self.lastTime = time.perf_counter()
+
+    def close(self):
+        # Writes the steps recorded since the last row, e.g. the end of a run that isn't a
+        # multiple of interval
+        if self.step > self.flushedStep:
+            self.flush()
+        self.file.close()
@@ -0,0 +1,34 @@
+import copy
+
+from environment import Environment, Orientation
+from maps import generateMap
+
+
+def tables(environment):
+    position = lambda cell: None if cell is None else (cell.x, cell.y)
+    return ([position(cell) for cell in environment.neighbours],
+            [[(action, orientation, position(cell)) for action, orientation, cell in moves] for moves in environment.moves])
+
+
+def test_setcell_walls_recompile_tables():
+    # Changing the walls of a cell after reset keeps the move tables equal to a full compile
+    environment = Environment()
+    environment.reset()
+    environment.setCell(4, 4, openOrientations={Orientation.UP, Orientation.LEFT})
+    environment.setCell(2, 0, agentIndex=0, agentOrientation=Orientation.RIGHT, openOrientations={Orientation.LEFT, Orientation.RIGHT})
+    environment.getLegalActions(0)
+
+    compiled = copy.deepcopy(environment)
+    compiled.compile()
+    assert tables(environment) == tables(compiled)
+
+
+def test_map_apply_restores_changed_walls():
+    # Resetting to a map after setCell changed a wall puts the map's walls back
+    gameMap = generateMap(8, 6, victims=4, hospitals=2, starts=2, seed=3)
+    environment = Environment(gameMap=gameMap)
+    environment.reset()
+    walls = [[cell.openMask for cell in column] for column in environment.cellGrid]
+    environment.setCell(0, 0, openOrientations=())
+    environment.reset()
+    assert [[cell.openMask for cell in column] for column in environment.cellGrid] == walls
@@ -0,0 +1,31 @@
+import pickle
+import random as rd
+
+import numpy as np
+
+from qtable import QTable
+
+
+def test_qtable_matches_dict():
+    # Random writes over narrow, 64-bit and wider keys read back like a dict of float32 values,
+    # through growth, rehashing, pickling and fromBuffers
+    rd.seed(0)
+    table = QTable(capacity=4)
+    expected = {}
+    states = [rd.getrandbits(rd.choice([5, 30, 63, 64, 70])) for _ in range(5000)]
+    for _ in range(20000):
+        key = rd.choice(states), rd.randrange(6)
+        value = rd.uniform(-50, 50)
+        table[key] = value
+        expected[key] = float(np.float32(value))
+
+    assert len(table) == len(expected)
+    assert dict(table.items()) == expected
+    assert table.get((1 << 80, 0)) is None and (12345678901, 1) not in table
+    assert dict(pickle.loads(pickle.dumps(table)).items()) == expected
+
+    values = np.frombuffer(table.values, dtype=np.float32)[:table.nStates * table.nActions].copy()
+    wrapped = QTable.fromBuffers(table.states, memoryview(values), len(table))
+    assert dict(wrapped.items()) == expected
+    wrapped[7, 2] = 1.5
+    assert wrapped[7, 2] == 1.5 and len(wrapped) == len(expected) + ((7, 2) not in expected)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from replaybuffer import SumTree
+
+
+@pytest.mark.parametrize("capacity", [1, 5, 32, 33, 1025, 40000])
+def test_sumtree_matches_cumulative_sums(capacity):
+    # Leaves found for uniform draws are those of a search in the cumulative priorities,
+    # with the sums kept up to date through single and batched updates
+    rng = np.random.default_rng(0)
+    tree = SumTree(capacity)
+    priorities = rng.random(capacity) + 0.01
+    for index, priority in enumerate(priorities):
+        tree.setOne(index, priority)
+    for _ in range(3):
+        indices = rng.integers(0, capacity, 50)
+        priorities[indices] = rng.random(50)
+        tree.set(indices, priorities[indices])
+        assert tree.total() == pytest.approx(priorities.sum())
+
+    values = rng.random(100000) * tree.total()
+    found = np.minimum(tree.find(values), capacity - 1)
+    expected = np.minimum(np.searchsorted(np.cumsum(priorities), values, side='right'), capacity - 1)
+    assert (found == expected).mean() > 0.999
@@ -0,0 +1,103 @@
+import copy
+import random as rd
+
+import pytest
+
+from distancefield import DistanceField
+from environment import Environment
+from maps import generateMap
+from rlagent import RLAgent
+from walkeragent import WalkerAgent
+
+
+def test_zobrist_incremental_keys_match_recompute():
+    # The key updated by every action equals the hash of the grid computed from scratch
+    rd.seed(0)
+    environment = Environment()
+    environment.reset()
+    environment.enableHashing(1)
+    agent = RLAgent(environment, 0)
+    walker = RLAgent(environment, 1)
+    for _ in range(5000):
+        environment.runStep(agent)
+        assert environment.getState() == environment.zobrist.encode(environment)
+        environment.runStep(walker, True)
+        assert environment.getState() == environment.zobrist.encode(environment)
+
+
+def test_zobrist_incremental_keys_match_recompute_with_runTick():
+    rd.seed(1)
+    environment = Environment(gameMap=generateMap(12, 10, victims=8, hospitals=2, starts=6, seed=4))
+    environment.reset()
+    environment.enableHashing(2)
+    agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+    for _ in range(5000):
+        environment.runTick(agents)
+        assert environment.getState() == environment.zobrist.encode(environment)
+
+
+def test_zobrist_keys_only_depend_on_the_grid():
+    # Same exact key, same hash, whatever the path that led to the grid
+    rd.seed(2)
+    environment = Environment()
+    environment.reset()
+    environment.enableHashing(3)
+    agent = RLAgent(environment, 0)
+    walker = RLAgent(environment, 1)
+    hashes = {}
+    for _ in range(5000):
+        environment.runStep(agent)
+        environment.runStep(walker, True)
+        assert hashes.setdefault(environment.encoder.encode(environment), environment.getState()) == environment.getState()
+
+
+def gridFromCells(environment):
+    # Agents and victims read from every cell, and checked against the incremental indexes
+    agents = {cell.agentFlag.index: (cell.x, cell.y, cell.agentFlag.orientation, tuple(sorted(cell.agentFlag.inventory)))
+              for column in environment.cellGrid for cell in column if cell.agentFlag.index != -1}
+    victims = {cell.victimFlag.index: (cell.x, cell.y) for column in environment.cellGrid for cell in column if cell.victimFlag.index != -1}
+    assert {agentId: (cell.x, cell.y) for agentId, cell in environment.agentCells.items()} == {agentId: agent[:2] for agentId, agent in agents.items()}
+    assert {victimId: (cell.x, cell.y) for victimId, cell in environment.victimCells.items()} == victims
+    assert environment.victimCount == len(victims)
+    assert environment.carriedCount == sum(len(agent[3]) for agent in agents.values())
+    return agents, victims, environment.saved, environment.step
+
+
+@pytest.mark.parametrize("gameMap, mode", [
+    (None, None),
+    (generateMap(15, 15, victims=8, starts=4, seed=2), None),
+    (None, "hashing"),
+    (None, "abstraction"),
+])
+def test_restore_matches_recompute(gameMap, mode):
+    # Restoring an earlier snapshot puts back the same grid, indexes, keys and distances as
+    # when it was taken, and the restored keys equal keys computed from scratch
+    rd.seed(0)
+    environment = Environment(gameMap=gameMap)
+    environment.reset()
+    if mode == "hashing":
+        environment.enableHashing(3)
+    elif mode == "abstraction":
+        environment.enableAbstraction(0, True, 2)
+    field = DistanceField(environment)
+    agents = [WalkerAgent(environment, agentId) for agentId in sorted(environment.agentCells)]
+    snapshots = []
+    restores = 0
+    for _ in range(10000):
+        if snapshots and rd.random() < 0.05:
+            snapshot, grid, distances, key = rd.choice(snapshots)
+            environment.restore(snapshot)
+            restores += 1
+            assert gridFromCells(environment) == grid
+            assert environment.getState() == key
+            assert [field.getDistance(agentId) for agentId in sorted(environment.agentCells)] == distances
+            fresh = copy.deepcopy(environment)
+            fresh.currentState = None
+            assert fresh.getState() == key
+        environment.runTick(agents)
+        if rd.random() < 0.02:
+            if rd.random() < 0.5:
+                environment.getState()  # snapshots with and without a cached key
+            snapshots.append((environment.snapshot(), gridFromCells(environment),
+                              [field.getDistance(agentId) for agentId in sorted(environment.agentCells)], environment.getState()))
+    assert restores > 0
@@ -0,0 +1,36 @@
+import csv
+
+from environment import Action, Environment, MAX_STEPS
+from telemetry import Telemetry
+
+
+class IdleAgent:
+    id = 0
+    epsilon = 0
+
+    def selectAction(self, state, legalActions=None):
+        return Action.NONE
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        pass
+
+
+def test_episode_lengths_count_learner_steps(tmp_path):
+    # Capped episodes are reported with the number of runStep calls they took, and close()
+    # writes the steps recorded since the last row
+    environment = Environment()
+    environment.reset()
+    agent = IdleAgent()
+    path = str(tmp_path / "metrics.csv")
+    environment.telemetry = Telemetry(path, agent, interval=MAX_STEPS)
+    calls = 3 * MAX_STEPS + 10
+    for _ in range(calls):
+        environment.runStep(agent)
+    environment.telemetry.close()
+
+    with open(path) as file:
+        rows = list(csv.DictReader(file))
+    assert int(rows[-1]["step"]) == calls
+    # The first episode also has the call made at step 0
+    assert [(int(row["episodes"]), float(row["length"])) for row in rows] == \
+            [(0, 0), (1, MAX_STEPS + 1), (1, MAX_STEPS), (1, MAX_STEPS)]
@@ -0,0 +1,74 @@
+import random as rd
+
+import numpy as np
+import pytest
+
+from environment import Environment, MAX_STEPS
+from maps import generateMap
+from vectorenvironment import VectorEnvironment
+
+
+class ScriptedAgent:
+    # Plays the action it is given through Environment.runStep and keeps the reward
+    def __init__(self, id):
+        self.id = id
+        self.action = None
+        self.reward = None
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        return self.action
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        self.reward = reward
+
+
+@pytest.mark.parametrize("gameMap", [None, generateMap(8, 6, victims=4, hospitals=2, starts=3, seed=3)])
+def test_lockstep_with_environment(gameMap):
+    # Random legal actions played in a VectorEnvironment and in as many Environment instances
+    # give the same legal actions, rewards, finality, resets and state keys
+    n = 4
+    random = rd.Random(0)
+    environments = [Environment(gameMap=gameMap) for _ in range(n)]
+    for environment in environments:
+        environment.reset()
+    vector = VectorEnvironment(environments[0], n, MAX_STEPS)
+    agentIds = sorted(environments[0].agentCells)
+    agents = [{agentId: ScriptedAgent(agentId) for agentId in agentIds} for _ in range(n)]
+    resets = 0
+
+    for tick in range(2000):
+        for agentId in agentIds:
+            legal = vector.getLegalActions(agentId)
+            actions = np.zeros(n, dtype=np.int64)
+            resetsDone = []
+            for k, environment in enumerate(environments):
+                legalActions = environment.getLegalActions(agentId)
+                assert sorted(np.flatnonzero(legal[k])) == sorted(legalActions)
+                actions[k] = random.choice(legalActions)
+                agents[k][agentId].action = actions[k]
+                step = environment.step
+                environment.runStep(agents[k][agentId])
+                resetsDone.append(environment.step != step + 1)  # a reset puts the step back to 1
+
+            rewards, final, done = vector.runStep(agentId, actions)
+            resets += int(done.sum())
+            assert list(rewards) == [agents[k][agentId].reward for k in range(n)]
+            assert list(done) == resetsDone
+            assert list(vector.saved) == [environment.saved for environment in environments]
+            assert list(vector.step) == [environment.step for environment in environments]
+            assert list(vector.getStates()) == [environment.encoder.encode(environment) for environment in environments]
+    assert resets > 0
+
+
+def test_states_round_trip():
+    environment = Environment()
+    environment.reset()
+    vector = VectorEnvironment(environment, 64, seed=0)
+    for _ in range(40):
+        for agentId in (0, 1):
+            vector.runStep(agentId, vector.sampleActions(vector.getLegalActions(agentId)))
+    keys = vector.getStates()
+    copy = VectorEnvironment(environment, 1)
+    copy.setStates(keys)
+    assert list(copy.getStates()) == list(keys)
+    assert (copy.inventoryCount == vector.inventoryCount).all()
@@ -0,0 +1,200 @@
+import numpy as np
+
+# Same values as environment.Action / environment.Orientation
+MOVE, LEFT, RIGHT, PICK, DROP, NONE = range(6)
+OFFSETS = ((0, -1), (+1, 0), (0, +1), (-1, 0))
+
+
+class VectorEnvironment:
+    # N copies of a DriveToGaether map stepped in lockstep with array ops. The static part of
+    # the map (walls, hospitals, victim and agent start cells) is read once from an
+    # Environment that has been reset; cells are indexed as x * h + y like in StateEncoder.
+    def __init__(self, environment, n: int=1024, maxSteps: int=150, seed=None):
+        self.n = n
+        self.w = environment.w
+        self.h = environment.h
+        self.nCells = self.w * self.h
+        self.maxSteps = maxSteps
+        self.rng = np.random.default_rng(seed)
+
+        self.openMask = np.zeros(self.nCells, dtype=np.uint8)
+        self.neighbour = np.full((self.nCells, 4), -1, dtype=np.int32)
+        self.hospital = np.zeros(self.nCells, dtype=bool)
+        self.victimBitAt = np.zeros(self.nCells, dtype=np.int64)
+
+        agents = []
+        victims = []
+        for column in environment.cellGrid:
+            for cell in column:
+                index = cell.x * self.h + cell.y
+                for orientation in cell.openOrientations:
+                    self.openMask[index] |= 1 << int(orientation)
+                    deltaX, deltaY = OFFSETS[orientation]
+                    self.neighbour[index, orientation] = (cell.x + deltaX) * self.h + cell.y + deltaY
+                self.hospital[index] = cell.hospitalFlag.index != -1
+                if cell.agentFlag.index != -1:
+                    agents.append((cell.agentFlag.index, index, int(cell.agentFlag.orientation), list(cell.agentFlag.inventory)))
+                if cell.victimFlag.index != -1:
+                    victims.append((cell.victimFlag.index, index))
+
+        agents.sort()
+        self.agentIds = [agentId for agentId, _, _, _ in agents]
+        self.agentSlots = {agentId: slot for slot, agentId in enumerate(self.agentIds)}
+        self.nAgents = len(agents)
+
+        victimIds = sorted([victimId for victimId, _ in victims] + [v for _, _, _, inventory in agents for v in inventory])
+        self.nVictims = len(victimIds)
+        victimBits = {victimId: 1 << i for i, victimId in enumerate(victimIds)}
+        for victimId, index in victims:
+            self.victimBitAt[index] = victimBits[victimId]
+
+        self.startCell = np.array([index for _, index, _, _ in agents], dtype=np.int32)
+        self.startOrientation = np.array([orientation for _, _, orientation, _ in agents], dtype=np.int8)
+        self.startInventory = np.array([sum(victimBits[v] for v in inventory) for _, _, _, inventory in agents], dtype=np.int64)
+        self.startCount = np.array([len(inventory) for _, _, _, inventory in agents], dtype=np.int8)
+        self.startVictims = sum(victimBits[victimId] for victimId, _ in victims)
+
+        self._allocate(n)
+        self.reset()
+
+    def _allocate(self, n):
+        self.n = n
+        self.agentCell = np.empty((n, self.nAgents), dtype=np.int32)
+        self.agentOrientation = np.empty((n, self.nAgents), dtype=np.int8)
+        self.inventory = np.empty((n, self.nAgents), dtype=np.int64)
+        self.inventoryCount = np.empty((n, self.nAgents), dtype=np.int8)
+        self.victims = np.empty(n, dtype=np.int64)
+        self.step = np.zeros(n, dtype=np.int32)
+        self.saved = np.zeros(n, dtype=np.int64)
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = slice(None)
+        self.agentCell[mask] = self.startCell
+        self.agentOrientation[mask] = self.startOrientation
+        self.inventory[mask] = self.startInventory
+        self.inventoryCount[mask] = self.startCount
+        self.victims[mask] = self.startVictims
+        self.step[mask] = 0
+
+    def _occupied(self, target):
+        return (self.agentCell == target[:, None]).any(axis=1)
+
+    def getLegalActions(self, agentId):
+        slot = self.agentSlots[agentId]
+        cell = self.agentCell[:, slot]
+        orientation = self.agentOrientation[:, slot]
+        count = self.inventoryCount[:, slot]
+
+        legal = np.zeros((self.n, 6), dtype=bool)
+        legal[:, NONE] = True
+        for action, turn in ((LEFT, -1), (MOVE, 0), (RIGHT, 1)):
+            target = self.neighbour[cell, (orientation + turn) % 4]
+            legal[:, action] = (target >= 0) & ~self._occupied(target)
+        legal[:, PICK] = (self.victims & self.victimBitAt[cell] != 0) & (count < 2)
+        legal[:, DROP] = self.hospital[cell] & (count > 0)
+
+        return legal
+
+    def doAction(self, agentId, actions):
+        slot = self.agentSlots[agentId]
+        cell = self.agentCell[:, slot]
+        orientation = self.agentOrientation[:, slot]
+        rewards = np.full(self.n, -1, dtype=np.int32)
+
+        turn = np.select([actions == LEFT, actions == RIGHT], [-1, 1], 0)
+        nextOrientation = (orientation + turn) % 4
+        target = self.neighbour[cell, nextOrientation]
+        moving = ((actions == LEFT) | (actions == MOVE) | (actions == RIGHT)) & (target >= 0)
+        moving &= ~self._occupied(np.where(moving, target, -1))
+        self.agentCell[moving, slot] = target[moving]
+        self.agentOrientation[moving, slot] = nextOrientation[moving]
+
+        bit = self.victimBitAt[cell]
+        picking = (actions == PICK) & (self.victims & bit != 0)
+        self.inventory[picking, slot] |= bit[picking]
+        self.inventoryCount[picking, slot] += 1
+        self.victims[picking] &= ~bit[picking]
+        rewards[picking] += 50
+
+        dropping = actions == DROP
+        dropped = np.where(dropping, self.inventoryCount[:, slot], 0).astype(np.int32)
+        self.saved += dropped
+        rewards += 100 * dropped
+        self.inventory[dropping, slot] = 0
+        self.inventoryCount[dropping, slot] = 0
+
+        return rewards
+
+    def isFinal(self):
+        return (self.victims == 0) & (self.inventoryCount == 0).all(axis=1)
+
+    def runStep(self, agentId, actions):
+        # Batched equivalent of Environment.runStep: act, check finality and auto-reset the
+        # copies that are final or reached the step cap
+        rewards = self.doAction(agentId, actions)
+        final = self.isFinal()
+        done = final | (self.step == self.maxSteps)
+        if done.any():
+            self.reset(done)
+        self.step += 1
+        return rewards, final, done
+
+    def sampleActions(self, legal):
+        scores = self.rng.random(legal.shape)
+        scores[~legal] = -1
+        return scores.argmax(axis=1)
+
+    def walkerActions(self, agentId):
+        # Random walker from Environment.runStep(..., idiotDuVillage=True): picks and drops
+        # whenever it can, otherwise a uniformly random legal action
+        legal = self.getLegalActions(agentId)
+        slot = self.agentSlots[agentId]
+        actions = self.sampleActions(legal)
+        onVictim = self.victims & self.victimBitAt[self.agentCell[:, slot]] != 0
+        actions = np.where(onVictim & legal[:, PICK], PICK, actions)
+        actions = np.where(~onVictim & legal[:, DROP], DROP, actions)
+        return actions
+
+    def setStates(self, keys):
+        # Inverse of getStates: one copy per key, so the number of copies becomes len(keys)
+        keys = np.asarray(keys, dtype=np.int64)
+        self._allocate(len(keys))
+        victimMask = (1 << self.nVictims) - 1
+        self.victims[:] = keys & victimMask
+        keys = keys >> self.nVictims
+        for slot in reversed(range(self.nAgents)):
+            self.inventory[:, slot] = keys & victimMask
+            keys = keys >> self.nVictims
+            self.agentOrientation[:, slot] = keys & 3
+            keys = keys >> 2
+            self.agentCell[:, slot] = keys % self.nCells
+            keys = keys // self.nCells
+        self.inventoryCount[:] = 0
+        for bit in range(self.nVictims):
+            self.inventoryCount += (self.inventory >> bit & 1).astype(np.int8)
+
+    def walkerProbabilities(self, agentId):
+        # Distribution of walkerActions over the 6 actions, for planning
+        legal = self.getLegalActions(agentId)
+        slot = self.agentSlots[agentId]
+        onVictim = self.victims & self.victimBitAt[self.agentCell[:, slot]] != 0
+        forced = np.full(self.n, -1)
+        forced[~onVictim & legal[:, DROP]] = DROP
+        forced[onVictim & legal[:, PICK]] = PICK
+        probabilities = legal / legal.sum(axis=1, keepdims=True)
+        probabilities[forced >= 0] = 0
+        probabilities[np.flatnonzero(forced >= 0), forced[forced >= 0]] = 1
+        return probabilities
+
+    def getStates(self):
+        # Same packing as StateEncoder.encode, so keys are interchangeable with Environment
+        bits = self.nAgents * (int(self.nCells * 4 - 1).bit_length() + self.nVictims) + self.nVictims
+        if bits > 63:
+            raise ValueError("state key does not fit in 64 bits (" + str(bits) + " bits)")
+
+        keys = np.zeros(self.n, dtype=np.int64)
+        for slot in range(self.nAgents):
+            keys = (keys * self.nCells + self.agentCell[:, slot]) * 4 + self.agentOrientation[:, slot]
+            keys = (keys << self.nVictims) | self.inventory[:, slot]
+        return (keys << self.nVictims) | self.victims
@@ -0,0 +1,16 @@
+class WalkerAgent:
+    # Scripted random walker of Environment.getWalkerAction with the RLAgent interface, for
+    # Environment.runTick
+    def __init__(self, environment, id=1):
+        self.id = id
+        self.environment = environment
+        self.epsilon = 1.0
+
+    def getBestPolicy(self, state, legalActions=None):
+        return self.environment.getWalkerAction(self.id, legalActions)
+
+    def selectAction(self, state, legalActions=None, forceExplore=False, debug=False):
+        return self.environment.getWalkerAction(self.id, legalActions)
+
+    def updateQValues(self, old_state, actionDone, state, reward, final=False, legalActions=None):
+        pass